@@ -1,17 +1,52 @@
+import functools
 import json
-import os
-import string
-from collections import Counter
+import threading
+import time
+from itertools import islice
 
-import nltk
-from flask import Flask, jsonify, render_template_string, request
+from flask import Flask, Response, g, jsonify, render_template_string, request
 
+import wiki_category_word_freq as wiki
+import wiki_metrics as metrics
 from color_palette import get_all_color_palettes
-from wiki_cache_utils import get_cache_path, save_result_cache
-from wiki_category_word_freq import (download_nltk_resources,
-                                     get_all_category_members, get_page_text)
+from wiki_cache_utils import (
+    RESULT_TTL,
+    STALE_TTL,
+    load_result_cache,
+    result_cache_age,
+    save_result_cache,
+)
+from wiki_category_word_freq import update_category_frequencies, warm_up
+from wiki_jobs import DONE, FAILED, JobRunner, QueueFull
+from wiki_memory_cache import LRUCache, SingleFlight
+from wiki_refresh import RefreshScheduler
+from wiki_responses import EncodedBody, send_body
 
 app = Flask(__name__)
+metrics.enable()
+
+# Serialized and compressed /wordcloud bodies, in memory in front of the
+# stored results
+response_cache = LRUCache(max_entries=256, max_bytes=32 * 1024**2)
+wordcloud_flights = SingleFlight()
+# Word clouds laid out on the server, as SVG, by (category, palette)
+svg_cache = LRUCache(max_entries=256, max_bytes=32 * 1024**2)
+layout_flights = SingleFlight()
+
+# Background word cloud jobs: worker threads and how many jobs may wait for one
+JOB_WORKERS = 2
+JOB_QUEUE_LIMIT = 16
+SSE_MIN_INTERVAL = 0.25
+
+# Background refreshes of expired or expiring results: worker threads, how
+# often the scheduler looks for due ones, and the age at which they are due
+REFRESH_WORKERS = 1
+REFRESH_INTERVAL = 60
+REFRESH_AFTER = 0.9 * RESULT_TTL
+
+# /compare: how many categories one request may compare, and words returned
+COMPARE_MAX_CATEGORIES = 50
+COMPARE_WORDS = 30
 
 # Simple HTML template with JS for word cloud and palette selection
 HTML_TEMPLATE = """
@@ -77,9 +112,6 @@ HTML_TEMPLATE = """
             </div>
         </main>
     </div>
-    <!-- d3 and d3-cloud via CDN -->
-    <script src="https://d3js.org/d3.v7.min.js"></script>
-    <script src="https://unpkg.com/d3-cloud/build/d3.layout.cloud.js"></script>
     <script>
     let palettes = {};
     let selectedPalette = null;
@@ -126,17 +158,34 @@ HTML_TEMPLATE = """
         let cloud = document.getElementById('wordcloud');
         cloud.innerHTML = '';
         
-        fetch(`/wordcloud?category=${encodeURIComponent(cat)}&palette=${encodeURIComponent(palette)}`)
+        // Crawl in a background job and follow its progress, then fetch the
+        // word cloud laid out by the server (cached per palette)
+        fetch('/jobs', {
+            method: 'POST',
+            headers: {'Content-Type': 'application/json'},
+            body: JSON.stringify({category: cat})
+        })
             .then(response => {
                 if (!response.ok) {
                     throw new Error(`HTTP error! Status: ${response.status}`);
                 }
                 return response.json();
             })
-            .then(data => {
+            .then(job => waitForJob(job))
+            .then(() => fetch(`/wordcloud.svg?category=${encodeURIComponent(cat)}&palette=${encodeURIComponent(palette)}`))
+            .then(response => {
+                if (response.status === 404) {
+                    return null;  // too few words for a cloud
+                }
+                if (!response.ok) {
+                    throw new Error(`HTTP error! Status: ${response.status}`);
+                }
+                return response.text();
+            })
+            .then(svg => {
                 // Hide progress indicator
                 document.getElementById('progress').classList.add('hidden');
-                renderWordCloud(data);
+                cloud.innerHTML = svg || '<div class="flex items-center justify-center h-full"><i>No data available.</i></div>';
             })
             .catch(error => {
                 document.getElementById('progress').classList.add('hidden');
@@ -144,127 +193,40 @@ HTML_TEMPLATE = """
                 console.error('Error:', error);
             });
     }
-    function renderWordCloud(data) {
-        let container = document.getElementById('wordcloud');
-        container.innerHTML = '<div class="flex items-center justify-center h-full"><span class="text-gray-400">Generating word cloud...</span></div>';
-        
-        if (!data || Object.keys(data).length === 0) {
-            container.innerHTML = '<div class="flex items-center justify-center h-full"><i>No data available.</i></div>';
+    function waitForJob(job) {
+        return new Promise((resolve, reject) => {
+            let source = new EventSource(`/jobs/${job.id}/events`);
+            source.onmessage = event => {
+                let state = JSON.parse(event.data);
+                showJobProgress(state);
+                if (state.status === 'done') {
+                    source.close();
+                    resolve();
+                } else if (state.status === 'failed') {
+                    source.close();
+                    reject(new Error(state.error || 'Job failed'));
+                }
+            };
+            source.onerror = () => {
+                source.close();
+                reject(new Error('Lost connection to the server'));
+            };
+        });
+    }
+    function showJobProgress(state) {
+        let p = state.progress;
+        if (state.status === 'queued') {
+            document.getElementById('progress-text').textContent = 'Waiting for a worker...';
             return;
         }
-        
-        // Get container dimensions - ensure we have enough space for a bigger word cloud
-        let width = Math.max(container.clientWidth, 1000);
-        let height = Math.max(container.clientHeight, 800);
-        
-        // Find min/max frequency
-        let values = Object.values(data);
-        let min = Math.min(...values), max = Math.max(...values);
-        
-        // Create a better scale for font sizes - more dramatic difference between small and large words
-        // Using a logarithmic scale to make the size differences more pronounced
-        let fontScale = v => {
-            // Ensure we don't have log(0) issues
-            if (min === max) return 40; // Default size if all words have same frequency
-            
-            // Log scale for better visual differentiation with more pronounced size differences
-            const normalized = (v - min) / (max - min || 1);
-            // Increase min and max font sizes for a bigger, more impressive word cloud
-            return Math.max(18, Math.min(120, 18 + 102 * Math.pow(normalized, 0.7)));
-        };
-        
-        // Get colors from the selected palette
-        let colors = palettes[selectedPalette] || ["#333"];
-        
-        // Sort words by frequency (highest first) and limit to top 150 for a richer word cloud
-        let sortedWords = Object.entries(data)
-            .sort((a, b) => b[1] - a[1])
-            .slice(0, 150)
-            .map(([text, freq]) => ({
-                text,
-                size: fontScale(freq),
-                freq
-            }));
-        
-        // Create the layout with better settings for a cloud appearance
-        let layout = d3.layout.cloud()
-            .size([width, height])
-            .words(sortedWords)
-            .padding(5)  // More padding for better readability and separation
-            .rotate(() => ~~(Math.random() * 3) * 45) // 0, 45, or 90 degrees for more variety while keeping readability
-            .spiral('archimedean')  // Explicitly set spiral type
-            .random(() => 0.5)  // Consistent random seed
-            .font('Arial')
-            .fontSize(d => d.size)
-            .on('end', draw);
-        
-        // Start the layout calculation
-        try {
-            layout.start();
-        } catch (e) {
-            console.error('Error generating word cloud:', e);
-            container.innerHTML = '<div class="flex items-center justify-center h-full"><p class="text-red-500">Error generating word cloud. Try with fewer words.</p></div>';
-        }
-        
-        // Draw function that renders the cloud once layout is calculated
-        function draw(words) {
-            if (!words || words.length === 0) {
-                container.innerHTML = '<div class="flex items-center justify-center h-full"><p>No words to display</p></div>';
-                return;
-            }
-            
-            container.innerHTML = '';
-            
-            // Create SVG with responsive sizing
-            let svg = d3.select(container)
-                .append('svg')
-                .attr('width', '100%')
-                .attr('height', '100%')
-                .attr('preserveAspectRatio', 'xMidYMid meet')
-                .attr('viewBox', [0, 0, width, height]);
-            
-            // Create group for the cloud centered in the SVG
-            let g = svg.append('g')
-                .attr('transform', `translate(${width/2},${height/2})`);
-            
-            // Add text elements for each word with enhanced styling
-            g.selectAll('text')
-                .data(words)
-                .enter().append('text')
-                .style('font-size', d => `${d.size}px`)
-                .style('font-family', '"Segoe UI", Arial, Helvetica, sans-serif')
-                .style('font-weight', d => d.size > 50 ? 'bold' : (d.size > 30 ? '600' : '400')) // Better weight distribution
-                .style('fill', (d, i) => colors[i % colors.length]) // Cycle through palette colors
-                .style('cursor', 'pointer')
-                .style('opacity', 0) // Start with opacity 0 for animation
-                .attr('text-anchor', 'middle')
-                .attr('transform', d => `translate(${d.x},${d.y})rotate(${d.rotate})`)
-                .text(d => d.text)
-                // Add subtle shadow to improve contrast and legibility
-                .style('text-shadow', d => d.size > 40 ? '1px 1px 2px rgba(0,0,0,0.2)' : 'none')
-                // Add hover effect for interactivity
-                .on('mouseover', function(event, d) {
-                    d3.select(this)
-                      .transition()
-                      .duration(200)
-                      .style('font-size', `${d.size * 1.1}px`)
-                      .style('fill-opacity', 0.8);
-                })
-                .on('mouseout', function(event, d) {
-                    d3.select(this)
-                      .transition()
-                      .duration(200)
-                      .style('font-size', `${d.size}px`)
-                      .style('fill-opacity', 1);
-                })
-                .transition() // Add a fade-in transition
-                .duration(800)
-                .delay((d, i) => i * 15) // Stagger the animations
-                .style('opacity', 1) // Fade in to full opacity
-                .selection() // Return to the selection for chaining
-                .append('title')
-                .text(d => `${d.text}: ${d.freq} occurrences`);
+        if (p.pages_discovered === undefined) {
+            return;
         }
+        document.getElementById('progress-text').textContent = 'Fetching data...';
+        document.getElementById('progress-detail').textContent =
+            `${p.pages_discovered} pages found, ` +
+            `${p.pages_fetched || 0}/${p.pages_to_fetch || 0} fetched, ` +
+            `${p.pages_tokenized || 0}/${p.pages_to_fetch || 0} tokenized`;
     }
     // No initial load; only generate on button click
     </script>
@@ -273,37 +235,49 @@ HTML_TEMPLATE = """
 """
 
 
-def compute_word_frequencies(category):
-    # Download NLTK resources if needed
-    download_nltk_resources()
-    stop_words = set(nltk.corpus.stopwords.words("english"))
+def compute_word_frequencies(category, progress=None):
+    """Return the category's [word, count] pairs, most common first."""
+    if wiki.DUMP_INDEX:
+        iter_pages_text = wiki.iter_pages_text
+    else:
+        # aiohttp (like NLTK) is only imported once something has to be crawled,
+        # so the page and /palettes are served as soon as the app starts
+        from wiki_async_fetch import iter_pages_text
+
+    # Only new or edited pages are fetched and tokenized; the rest of the
+    # category total is carried over from the previous run
+    freq = update_category_frequencies(
+        category, fetch_texts=iter_pages_text, progress=progress
+    )
+    return freq.most_common()
 
-    titles = get_all_category_members(category)
-    if not titles:
-        return {}  # Return empty dict if no pages found
 
-    words = []
-    for title in titles:
-        text = get_page_text(title)
-        if not text:
-            continue
+def top_words(freq, n=300):
+    # Get top 300 words to ensure we have enough for a richer visualization,
+    # skipping words too short to be interesting in a word cloud
+    words = ((w, c) for w, c in freq if len(w) > 2)
+    return dict(islice(words, n))
 
-        tokens = nltk.word_tokenize(text)
-        for w in tokens:
-            w = w.lower()
-            # Filter out short words, stopwords, punctuation, and non-alphabetic words
-            if (
-                len(w) <= 2
-                or w in stop_words
-                or w in string.punctuation
-                or not w.isalpha()
-            ):
-                continue
-            words.append(w)
 
-    # Get top 300 words to ensure we have enough for a richer visualization
-    freq = dict(Counter(words).most_common(300))
-    return freq
+@app.before_request
+def start_timer():
+    g.request_start = time.perf_counter()
+
+
+@app.after_request
+def record_request(response):
+    # Label by route pattern, not path, to keep the number of series bounded
+    endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+    seconds = time.perf_counter() - g.request_start
+    status = response.status_code
+    metrics.inc("wiki_http_requests_total", endpoint=endpoint, status=status)
+    metrics.observe("wiki_http_request_seconds", seconds, endpoint=endpoint)
+    return response
+
+
+@app.route("/metrics")
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
 
 
 @app.route("/")
@@ -311,11 +285,71 @@ def index():
     return render_template_string(HTML_TEMPLATE)
 
 
+# The palettes only change with the code, so they are built once
+color_palettes = functools.cache(get_all_color_palettes)
+
+
+@functools.cache
+def palettes_body():
+    palettes = color_palettes()
+    # Return as {name: [color1, color2, ...]}
+    return EncodedBody(json.dumps({k: v.colors for k, v in palettes.items()}).encode())
+
+
 @app.route("/palettes")
 def palettes():
-    palettes = get_all_color_palettes()
-    # Return as {name: [color1, color2, ...]}
-    return jsonify({k: v.colors for k, v in palettes.items()})
+    return send_body(palettes_body(), cache_control="public, max-age=3600")
+
+
+def result_key(category):
+    # Approximate counts (WIKI_MAX_WORDS) are stored apart from exact ones
+    return wiki.category_key(category, max_words=wiki.MAX_WORDS)
+
+
+def stored_result(category):
+    """Return the stored counts of a category, refreshing them if expired.
+
+    Expired counts are still returned for STALE_TTL while a background job
+    recomputes them.
+    """
+    table = load_result_cache(result_key(category), RESULT_TTL + STALE_TTL)
+    if table is not None and is_stale(table):
+        try:
+            refresher.submit(category)
+        except QueueFull:
+            pass  # the scheduler will retry it
+    return table
+
+
+def is_stale(table):
+    return time.time() - table.saved_at > RESULT_TTL
+
+
+def build_wordcloud(category, force_refresh=False, progress=None):
+    """Return the encoded /wordcloud response body for a category."""
+    # Check if we should use cache
+    if not force_refresh:
+        cached = stored_result(category)
+        if cached is not None and len(cached) >= 10:
+            body = EncodedBody(json.dumps(top_words(cached)).encode())
+            if is_stale(cached):
+                # Served at once, but flagged and not kept, while the refresh
+                # job runs
+                body.headers["X-Cache-Status"] = "stale; revalidating"
+            else:
+                response_cache.set(category, body)
+            return body
+
+    # Compute frequencies
+    freq = compute_word_frequencies(category, progress)
+    body = EncodedBody(json.dumps(top_words(freq)).encode())
+
+    # If we have enough words, save to cache
+    if len(freq) >= 10:
+        save_result_cache(result_key(category), freq)
+        response_cache.set(category, body)
+
+    return body
 
 
 @app.route("/wordcloud")
@@ -323,29 +357,188 @@ def wordcloud():
     category = request.args.get("category", "Physics")
     palette_name = request.args.get("palette", "Pastel")
     force_refresh = request.args.get("refresh", "").lower() == "true"
+    scheduler.record(category)
 
-    cache_path = get_cache_path(category)
+    body = None if force_refresh else response_cache.get(category)
+    result = "miss" if body is None else "hit"
+    metrics.inc("wiki_cache_requests_total", kind="response", result=result)
+    if body is None:
+        # Concurrent misses for the same category share one computation
+        body = wordcloud_flights.do(
+            (category, force_refresh), lambda: build_wordcloud(category, force_refresh)
+        )
+    return send_body(body)
 
-    # Check if we should use cache
-    if not force_refresh and os.path.exists(cache_path):
+
+def build_wordcloud_svg(category, palette):
+    # NumPy is only imported once a cloud is laid out
+    from wiki_layout import MAX_WORDS, wordcloud_svg
+
+    table = category_table(category)
+    if table is None:
+        return None
+    words = top_words(table, MAX_WORDS).items()
+    # Laid out once, at the default size: the viewBox scales it to any other
+    svg = wordcloud_svg(words, palette)
+    return EncodedBody(svg.encode(), mimetype="image/svg+xml")
+
+
+@app.route("/wordcloud.svg")
+def wordcloud_svg():
+    category = request.args.get("category", "Physics")
+    palette_name = request.args.get("palette") or "Pastel"
+    palette = color_palettes().get(palette_name)
+    if palette is None:
+        return jsonify({"error": f"unknown palette {palette_name!r}"}), 400
+    scheduler.record(category)
+
+    key = (category, palette_name)
+    body = svg_cache.get(key)
+    if body is None:
+        body = layout_flights.do(key, lambda: build_wordcloud_svg(category, palette))
+        if body is None:
+            return jsonify({"error": "too few words"}), 404
+        svg_cache.set(key, body)
+    return send_body(body)
+
+
+def category_table(category):
+    """Return a category's stored word counts, crawling it first if needed."""
+    table = stored_result(category)
+    if table is None:
+        wordcloud_flights.do((category, False), lambda: build_wordcloud(category))
+        table = stored_result(category)
+    return table
+
+
+@app.route("/compare")
+def compare():
+    """Each category's most distinctive words against the others."""
+    # NumPy is only imported once something is compared
+    from wiki_compare import DEFAULT_METHOD, METHODS, distinctive_words
+    from wiki_freq_store import VocabularyReset
+
+    categories = list(dict.fromkeys(request.args.getlist("category")))
+    method = request.args.get("method", DEFAULT_METHOD)
+    n = request.args.get("n", COMPARE_WORDS, type=int)
+    if not 2 <= len(categories) <= COMPARE_MAX_CATEGORIES:
+        error = f"give between 2 and {COMPARE_MAX_CATEGORIES} categories"
+        return jsonify({"error": error}), 400
+    if method not in METHODS:
+        return jsonify({"error": f"method must be one of {', '.join(METHODS)}"}), 400
+    if not 0 < n <= 300:
+        return jsonify({"error": "n must be between 1 and 300"}), 400
+
+    for attempt in range(2):
+        tables = [category_table(category) for category in categories]
+        missing = [c for c, table in zip(categories, tables) if table is None]
+        if missing:
+            return jsonify({"error": "too few words", "categories": missing}), 404
         try:
-            with open(cache_path, "r") as f:
-                cached_data = json.load(f)
-                if cached_data and len(cached_data) >= 10:
-                    return jsonify(cached_data)
-        except (json.JSONDecodeError, IOError):
-            # If cache is corrupted, continue to recompute
-            pass
+            words = distinctive_words(tables, n, method)
+            break
+        except VocabularyReset:
+            # A crawl's save reset the store, dropping the tables loaded before
+            # it: they are computed again, from the per-page counts
+            if attempt:
+                raise
+    return jsonify(
+        {
+            "method": method,
+            "categories": {
+                category: [
+                    {"word": word, "score": score, "count": count}
+                    for word, score, count in top
+                ]
+                for category, top in zip(categories, words)
+            },
+        }
+    )
 
-    # Compute frequencies
-    freq = compute_word_frequencies(category)
 
-    # If we have enough words, save to cache
-    if freq and len(freq) >= 10:
-        save_result_cache(category, freq)
+def run_wordcloud_job(category, progress):
+    if response_cache.get(category) is None:
+        wordcloud_flights.do(
+            (category, False), lambda: build_wordcloud(category, progress=progress)
+        )
+
+
+jobs = JobRunner(
+    run_wordcloud_job, max_workers=JOB_WORKERS, max_queued=JOB_QUEUE_LIMIT
+)
+
+
+def refresh_wordcloud(category, progress):
+    # Incremental: only pages edited since the last count are fetched again
+    try:
+        wordcloud_flights.do(
+            (category, True), lambda: build_wordcloud(category, True, progress)
+        )
+    finally:
+        # Nothing laid out from the old counts outlives the refresh
+        response_cache.discard(category)
+        for palette_name in color_palettes():
+            svg_cache.discard((category, palette_name))
+
+
+refresher = JobRunner(
+    refresh_wordcloud, max_workers=REFRESH_WORKERS, max_queued=JOB_QUEUE_LIMIT
+)
+# Started by the first request it records
+scheduler = RefreshScheduler(
+    age=lambda category: result_cache_age(result_key(category)),
+    submit=refresher.submit,
+    refresh_after=REFRESH_AFTER,
+    interval=REFRESH_INTERVAL,
+)
+
+
+@app.route("/jobs", methods=["POST"])
+def submit_job():
+    data = request.get_json(silent=True) or request.values
+    category = data.get("category")
+    if not category:
+        return jsonify({"error": "category is required"}), 400
+    try:
+        job = jobs.submit(category)
+    except QueueFull as e:
+        return jsonify({"error": str(e)}), 503, {"Retry-After": "10"}
+    return jsonify(job.snapshot()), 202
+
+
+@app.route("/jobs/<job_id>")
+def job_status(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "unknown job"}), 404
+    return jsonify(job.snapshot())
+
+
+@app.route("/jobs/<job_id>/events")
+def job_events(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "unknown job"}), 404
+
+    def stream():
+        # Server-sent events: one snapshot per change, coalesced so a fast
+        # crawl doesn't send an event for every page
+        while True:
+            version = job.version
+            snapshot = job.snapshot()
+            yield f"data: {json.dumps(snapshot)}\n\n"
+            if snapshot["status"] in (DONE, FAILED):
+                return
+            time.sleep(SSE_MIN_INTERVAL)
+            if job.wait_for_change(version, timeout=15) == version:
+                yield ": keep-alive\n\n"
 
-    return jsonify(freq)
+    return Response(
+        stream(), mimetype="text/event-stream", headers={"Cache-Control": "no-cache"}
+    )
 
 
 if __name__ == "__main__":
+    # Load NLTK in the background so the first crawl doesn't wait for it
+    threading.Thread(target=warm_up, daemon=True).start()
     app.run(debug=True)
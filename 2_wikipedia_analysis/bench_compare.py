@@ -0,0 +1,109 @@
+"""Time /compare's scoring of many categories, and check it against plain Python.
+
+Stores synthetic categories (see bench_freq_store.py) and times
+`distinctive_words` on all of them with each method, from loading the
+memory-mapped tables to the top words. The scores of a smaller comparison
+are checked against a direct dict-based implementation of the formulas.
+
+    python bench_compare.py --categories 50 --words 30000
+"""
+
+import argparse
+import math
+import tempfile
+import time
+from collections import Counter
+
+import wiki_cache_utils
+from bench_freq_store import synthetic_categories
+from wiki_compare import METHODS, distinctive_words
+
+
+def reference_scores(categories, method):
+    """The scores of every word in every category, one dict lookup at a time."""
+    totals = {c: sum(freq.values()) for c, freq in categories.items()}
+    word_totals, document_frequency = {}, {}
+    for freq in categories.values():
+        for word, count in freq.items():
+            word_totals[word] = word_totals.get(word, 0) + count
+            document_frequency[word] = document_frequency.get(word, 0) + 1
+    total = sum(totals.values())
+    prior = len(word_totals)
+    scores = {}
+    for category, freq in categories.items():
+        for word, count in freq.items():
+            if method == "tf-idf":
+                idf = math.log(len(categories) / document_frequency[word])
+                score = count / totals[category] * idf
+            else:
+                alpha = prior * word_totals[word] / total
+                rest = word_totals[word] - count
+                rest_total = total - totals[category]
+                delta = math.log(
+                    (count + alpha) / (totals[category] + prior - count - alpha)
+                ) - math.log((rest + alpha) / (rest_total + prior - rest - alpha))
+                score = delta / math.sqrt(1 / (count + alpha) + 1 / (rest + alpha))
+            scores[category, word] = score
+    return scores
+
+
+def load_tables(categories):
+    return [wiki_cache_utils.load_result_cache(c) for c in categories]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--categories", type=int, default=50)
+    parser.add_argument("--words", type=int, default=30000)
+    parser.add_argument("--top", type=int, default=30)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        wiki_cache_utils.CACHE_DIR = tmp
+        small = synthetic_categories(5, 2000, seed=1)
+        # An empty category, last: it still counts towards the IDF
+        small["Empty category"] = Counter()
+        for category, freq in small.items():
+            wiki_cache_utils.save_result_cache(category, freq)
+        for method in METHODS:
+            expected = reference_scores(small, method)
+            results = distinctive_words(load_tables(small), 100, method)
+            # Scores don't depend on the order the categories are given in
+            reordered = list(small)[-1:] + list(small)[:-1]
+            moved = distinctive_words(load_tables(reordered), 100, method)
+            assert moved[1:] + moved[:1] == results, f"{method} depends on order"
+            assert results[-1] == [], "the empty category has words"
+            for category, top in zip(list(small)[:-1], results):
+                for word, score, count in top:
+                    assert count == small[category][word], "count differs"
+                    assert math.isclose(
+                        score, expected[category, word], rel_tol=1e-3, abs_tol=1e-4
+                    ), f"{method} score of {word!r} differs"
+                best = max(v for (c, _), v in expected.items() if c == category)
+                assert math.isclose(top[0][1], best, rel_tol=1e-3), "wrong top word"
+
+        categories = synthetic_categories(args.categories, args.words)
+        for category, freq in categories.items():
+            wiki_cache_utils.save_result_cache(category, freq)
+        tables = load_tables(categories)
+        entries = sum(map(len, tables))
+        vocabulary = len(tables[0].vocabulary.words)
+        print(
+            f"{len(tables)} categories, {entries:,} entries, "
+            f"{vocabulary:,} words in the vocabulary"
+        )
+        for method in METHODS:
+            times = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                distinctive_words(load_tables(categories), args.top, method)
+                times.append(time.perf_counter() - start)
+            print(
+                f"{method:<9} best {min(times) * 1000:7.1f} ms, "
+                f"worst {max(times) * 1000:7.1f} ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""Measure recursive category crawls on a synthetic category tree.
+
+Builds a tree of categories on the fake MediaWiki API with extra links back
+up the tree (cycles) and across it (categories and pages reachable through
+several paths), then crawls it cold, again after some edits, and from a
+subtree whose listings are already cached. Each crawl is checked to return
+every reachable page exactly once with its current revision.
+
+    python bench_crawl.py --fanout 4 --depth 3 --pages-per-category 50
+"""
+
+import argparse
+import random
+import tempfile
+import time
+
+import wiki_cache_utils
+import wiki_category_word_freq as wiki
+from fake_mediawiki import FakeMediaWiki
+
+
+def build_tree(fake, fanout, depth, pages_per_category, seed=0):
+    """Add a category tree to `fake` and return its root."""
+    rng = random.Random(seed)
+    levels = [[f"Tree_root_{pages_per_category}"]]
+    for level in range(1, depth + 1):
+        levels.append(
+            [f"Tree_{level}x{i}_{pages_per_category}" for i in range(fanout**level)]
+        )
+        for i, category in enumerate(levels[level]):
+            parent = levels[level - 1][i // fanout]
+            fake.subcategories.setdefault(parent, []).append(category)
+    for level in range(1, depth + 1):
+        for category in levels[level]:
+            # A link to any category up to this level: a cycle when it points
+            # at an ancestor, a second path to it otherwise.
+            target = rng.choice(rng.choice(levels[: level + 1]))
+            fake.subcategories.setdefault(category, []).append(target)
+    return levels[0][0]
+
+
+def reachable(fake, root, depth):
+    seen, frontier = {root}, [root]
+    for _ in range(depth):
+        subcategories = []
+        for category in frontier:
+            for sub in fake.subcategories.get(category, []):
+                if sub not in seen:
+                    seen.add(sub)
+                    subcategories.append(sub)
+        frontier = subcategories
+    return seen
+
+
+def check(fake, pages, categories):
+    expected = {
+        fake.page_id(title)
+        for category in categories
+        for title in fake.page_titles(category)
+    }
+    ids = [page["pageid"] for page in pages]
+    assert len(ids) == len(set(ids)), "a page was returned twice"
+    assert set(ids) == expected, "the crawl missed or invented pages"
+    for page in pages:
+        assert page["lastrevid"] == fake.last_revid(page["title"]), "stale revision"
+
+
+def crawl(fake, label, root, depth, max_pages=None):
+    fake.calls.clear()
+    start = time.perf_counter()
+    pages = wiki.crawl_category_tree(root, depth, max_pages)
+    elapsed = time.perf_counter() - start
+    calls = ", ".join(f"{kind}={n}" for kind, n in sorted(fake.calls.items()))
+    print(f"{label:<22} {len(pages):>7} {elapsed:>9.3f}  {calls}")
+    return pages
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--fanout", type=int, default=4)
+    parser.add_argument("--depth", type=int, default=3)
+    parser.add_argument("--pages-per-category", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.02)
+    parser.add_argument("--edited", type=float, default=0.05)
+    args = parser.parse_args()
+
+    with FakeMediaWiki(
+        latency=args.latency
+    ) as fake, tempfile.TemporaryDirectory() as cache_dir:
+        wiki.API_URL = fake.url
+        wiki_cache_utils.CACHE_DIR = cache_dir
+        root = build_tree(fake, args.fanout, args.depth, args.pages_per_category)
+        categories = reachable(fake, root, args.depth)
+        print(f"{len(categories)} categories within depth {args.depth} of {root}\n")
+        print(f"{'crawl':<22} {'pages':>7} {'seconds':>9}  requests")
+
+        pages = crawl(fake, "cold", root, args.depth)
+        check(fake, pages, categories)
+
+        edited = random.Random(1).sample(pages, int(len(pages) * args.edited))
+        for page in edited:
+            fake.edit(page["title"])
+        pages = crawl(fake, f"{args.edited:.0%} edited", root, args.depth)
+        check(fake, pages, categories)
+        assert not fake.calls["info"], "cached listings were queried again"
+
+        subtree = fake.subcategories[root][0]
+        pages = crawl(fake, "overlapping subtree", subtree, args.depth - 1)
+        check(fake, pages, reachable(fake, subtree, args.depth - 1))
+        assert not fake.calls["info"], "cached listings were queried again"
+
+        cap = len(pages) // 3
+        pages = crawl(fake, f"capped at {cap}", root, args.depth, max_pages=cap)
+        assert len(pages) == cap, "the page cap was not respected"
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""Measure dump ingestion and check the index it builds.
+
+Writes a synthetic multistream dump (bz2 streams of 100 pages plus the
+offset index, like the pages-articles-multistream files) whose wikitext uses
+templates, tables, refs, links and category links, then ingests it with and
+without the index and with different worker counts. Each index is checked
+for category membership, for markup left in the texts, and for giving the
+same word counts through the dump-backed pipeline as the rendered pages.
+
+    python bench_dump.py --pages 20000 --workers 1 2 4
+"""
+
+import argparse
+import bz2
+import os
+import random
+import tempfile
+import time
+from collections import Counter
+from xml.sax.saxutils import escape
+
+import wiki_cache_utils
+import wiki_category_word_freq as wiki
+import wiki_dump
+from fake_mediawiki import FILLER, VOCABULARY
+
+PAGES_PER_STREAM = 100
+HEADER = (
+    '<mediawiki xmlns="http://www.mediawiki.org/xml/export-0.11/" xml:lang="en">\n'
+    "  <siteinfo><sitename>Wikipedia</sitename></siteinfo>\n"
+)
+# Markup whose contents must not reach the extracted text.
+HIDDEN = ("Infobox", "wikitable", "cite", "thumb", "Category", "href")
+
+
+def sentence(rng, n=12):
+    pools = [FILLER if rng.random() < 0.4 else VOCABULARY for _ in range(n)]
+    words = [rng.choice(pool) for pool in pools]
+    return " ".join(words).capitalize() + "."
+
+
+def wikitext(rng, title, categories):
+    """Article wikitext, and the words a reader would see in it."""
+    body = [sentence(rng) for _ in range(rng.randint(4, 12))]
+    link = rng.choice(VOCABULARY)
+    text = (
+        "{{Infobox thing|name=" + title + "|note={{nowrap|cite thumb}}}}\n"
+        f"'''{title}''' is about [[{link.capitalize()} (physics)|{link}]] and "
+        f"[[{link}]].<ref>{{{{cite web|url=http://example.org|title=href}}}}</ref>\n"
+        + "\n".join(body[: len(body) // 2])
+        + "\n\n== History ==\n* "
+        + "\n* ".join(body[len(body) // 2 :])
+        + "\n[http://example.org/x Further details]\n"
+        '{| class="wikitable"\n| cite || thumb\n|}\n'
+        "[[File:Example.jpg|thumb|A [[Category]] href]]\n"
+        "<!-- Infobox -->\n"
+        + "\n".join(f"[[Category:{c.replace('_', ' ')}]]" for c in categories)
+    )
+    visible = f"{title} is about {link} and {link}. " + " ".join(body)
+    visible += " History Further details"
+    return text, visible
+
+
+def page_xml(title, ns, pageid, revid, text):
+    return (
+        f"  <page>\n    <title>{escape(title)}</title>\n    <ns>{ns}</ns>\n"
+        f"    <id>{pageid}</id>\n    <revision>\n      <id>{revid}</id>\n"
+        f'      <text xml:space="preserve">{escape(text)}</text>\n'
+        "    </revision>\n  </page>\n"
+    )
+
+
+def write_dump(path, index_path, pages, topics, seed=0):
+    """Write a synthetic dump; return {category: titles} and {title: visible text}."""
+    rng = random.Random(seed)
+    entries, members, visible = [], {}, {}
+    for i in range(topics):
+        title = f"Category:Dump topic {i}"
+        entries.append((title, 14, "[[Category:Dump root]]"))
+    for i in range(pages):
+        title = f"Dump article {i}"
+        categories = rng.sample([f"Dump_topic_{t}" for t in range(topics)], 2)
+        text, visible[title] = wikitext(rng, title, categories)
+        entries.append((title, 0, text))
+        for category in categories:
+            members.setdefault(category, set()).add(title)
+    # A redirect and a talk page, both left out of the index.
+    entries.append(("Dump redirect", 0, "#REDIRECT [[Dump article 0]]"))
+    entries.append(("Talk:Dump article 0", 1, "[[Category:Dump topic 0]]"))
+
+    with open(path, "wb") as dump, bz2.open(index_path, "wt") as index:
+        dump.write(bz2.compress(HEADER.encode()))
+        for start in range(0, len(entries), PAGES_PER_STREAM):
+            offset = dump.tell()
+            chunk = []
+            for pageid, (title, ns, text) in enumerate(
+                entries[start : start + PAGES_PER_STREAM], start + 1
+            ):
+                xml = page_xml(title, ns, pageid, pageid * 10, text)
+                if title == "Dump redirect":
+                    redirect = '<ns>0</ns><redirect title="x" />'
+                    xml = xml.replace("<ns>0</ns>", redirect)
+                chunk.append(xml)
+                index.write(f"{offset}:{pageid}:{title}\n")
+            dump.write(bz2.compress("".join(chunk).encode()))
+        dump.write(bz2.compress(b"</mediawiki>\n"))
+    return members, visible
+
+
+def check(index, members, visible, stop_words):
+    for category, titles in members.items():
+        pages = wiki_dump.category_pages(index, category)
+        found = {page["title"] for page in pages}
+        assert found == titles, f"{category} members differ"
+    node = wiki_dump.category_node(index, "Dump root")
+    assert sorted(node["subcategories"]) == sorted(members), "category graph differs"
+
+    wiki.DUMP_INDEX = index
+    pages = wiki.crawl_category_tree("Dump_root", max_depth=1)
+    assert len(pages) == len(visible), "crawl over the dump missed pages"
+    expected = Counter()
+    for text in visible.values():
+        expected.update(wiki.count_page_words(text, stop_words))
+    counted = Counter()
+    for page, text in wiki.iter_pages_text(pages):
+        assert not any(word in text for word in HIDDEN), f"markup left: {text!r}"
+        counted.update(wiki.count_page_words(text, stop_words))
+    assert counted == expected, "texts differ from the rendered pages"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, default=5000)
+    parser.add_argument("--topics", type=int, default=20)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    args = parser.parse_args()
+    stop_words = wiki.get_stop_words()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        wiki_cache_utils.CACHE_DIR = tmp
+        dump = os.path.join(tmp, "dump.xml.bz2")
+        index_file = os.path.join(tmp, "index.txt.bz2")
+        members, visible = write_dump(dump, index_file, args.pages, args.topics)
+        size = os.path.getsize(dump) / 1024**2
+        cores = os.cpu_count()
+        print(f"{args.pages} articles, {size:.1f} MiB of bz2, {cores} cores")
+        print(f"{'mode':<18} {'seconds':>8} {'pages/s':>9} {'MiB/s':>7}")
+        runs = [("one pass", None, 1)] + [
+            (f"multistream x{n}", index_file, n) for n in args.workers
+        ]
+        for label, index_path, workers in runs:
+            output = os.path.join(tmp, f"index-{label.replace(' ', '-')}.sqlite3")
+            start = time.perf_counter()
+            stats = wiki_dump.ingest(dump, output, index_path, workers)
+            elapsed = time.perf_counter() - start
+            print(
+                f"{label:<18} {elapsed:>8.2f} {stats['pages'] / elapsed:>9.0f} "
+                f"{size / elapsed:>7.2f}"
+            )
+            check(output, members, visible, stop_words)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Compare serial and concurrent page retrieval against the fake MediaWiki API.
+
+The last two runs share a page cache: the first fills it, then a fraction of
+pages is edited and the refresh only refetches those.
+
+    python bench_fetch.py --pages 400 --latency 0.05
+"""
+
+import argparse
+import io
+import tempfile
+import time
+from contextlib import redirect_stdout
+
+import wiki_cache_utils
+import wiki_category_word_freq as wiki
+from fake_mediawiki import FakeMediaWiki
+from wiki_async_fetch import iter_category_texts
+
+
+def run_serial(category):
+    # The CLI's default path, on a fresh page cache; its progress lines are
+    # dropped so they don't break up the table
+    with tempfile.TemporaryDirectory() as cache_dir, redirect_stdout(io.StringIO()):
+        wiki_cache_utils.CACHE_DIR = cache_dir
+        pages = wiki.get_category_pages(category)
+        return sum(1 for _ in wiki.iter_pages_text(pages))
+
+
+def run_async(category, concurrency):
+    return sum(1 for _ in iter_category_texts(category, concurrency=concurrency))
+
+
+def run_cold(category, concurrency):
+    # A fresh page cache per run so every run is a cold fetch.
+    with tempfile.TemporaryDirectory() as cache_dir:
+        wiki_cache_utils.CACHE_DIR = cache_dir
+        return run_async(category, concurrency)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, default=400)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument(
+        "--edited",
+        type=float,
+        default=0.05,
+        help="fraction of pages edited before the refresh run (default: 0.05)",
+    )
+    args = parser.parse_args()
+    category = f"Synthetic_{args.pages}"
+    cache_dir = tempfile.TemporaryDirectory()
+
+    def run_refresh(concurrency):
+        titles = fake.page_titles(category)
+        for title in titles[: int(len(titles) * args.edited)]:
+            fake.edit(title)
+        return run_async(category, concurrency)
+
+    with FakeMediaWiki(latency=args.latency) as fake, cache_dir:
+        wiki.API_URL = fake.url
+        runs = [("serial", lambda: run_serial(category))]
+        for n in args.concurrency:
+            runs.append((f"async x{n}", lambda n=n: run_cold(category, n)))
+        n = max(args.concurrency)
+        runs.append(("prime cache", lambda: run_async(category, n)))
+        runs.append(("refresh", lambda: run_refresh(n)))
+
+        print(f"{args.pages} pages, {args.latency * 1000:.0f} ms simulated latency")
+        print(f"{'mode':<12} {'pages':>6} {'requests':>9} {'seconds':>8} {'pages/s':>9}")
+        for name, run in runs:
+            wiki_cache_utils.CACHE_DIR = cache_dir.name
+            before = fake.request_count
+            start = time.perf_counter()
+            pages = run()
+            elapsed = time.perf_counter() - start
+            requests = fake.request_count - before
+            print(
+                f"{name:<12} {pages:>6} {requests:>9} {elapsed:>8.2f} {pages / elapsed:>9.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
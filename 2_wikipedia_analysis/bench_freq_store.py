@@ -0,0 +1,186 @@
+"""Compare the NumPy frequency store with the JSON results it replaces.
+
+Stores the word counts of a set of categories both ways: as the JSON
+`most_common()` lists previously written to the SQLite cache, and as id/count
+tables over the shared vocabulary. Reports the size on disk, the memory held
+after loading every category, the time of a top-300 lookup and of merging
+all categories, and checks that both hold the same counts.
+
+Without a recording the categories are synthetic: Zipf-distributed words from
+one shared vocabulary, so that common words recur across categories as they
+do on Wikipedia. A recording made with `fake_mediawiki.py --record` gives the
+numbers for real categories.
+
+    python bench_freq_store.py --categories 40 --words 20000
+    python bench_freq_store.py --recording fixtures/physics.json
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+from collections import Counter
+
+import numpy as np
+
+import wiki_cache_utils
+import wiki_category_word_freq as wiki
+import wiki_freq_store
+
+LETTERS = "etaoinshrdlcumwfgypbvkjxqz"
+
+
+def synthetic_categories(n, words, seed=0):
+    """n categories of about `words` distinct words each, Zipf distributed."""
+    rng = np.random.default_rng(seed)
+    lengths = rng.integers(3, 14, size=words * 10)
+    letters = rng.choice(list(LETTERS), size=(words * 10, 14), p=_letter_weights())
+    words_iter = ("".join(row[:k]) for row, k in zip(letters, lengths))
+    vocabulary = list(dict.fromkeys(words_iter))
+    categories = {}
+    for i in range(n):
+        # Each category favours its own topic words over the shared ranking
+        ranks = rng.zipf(1.1, size=words * 20) - 1
+        ranks = ranks[ranks < len(vocabulary)]
+        topic = rng.permutation(len(vocabulary))[: words // 10]
+        ranks[: len(ranks) // 5] = rng.choice(topic, size=len(ranks) // 5)
+        ids, counts = np.unique(ranks, return_counts=True)
+        categories[f"Synthetic topic {i}"] = Counter(
+            dict(zip((vocabulary[j] for j in ids), counts.tolist()))
+        )
+    return categories
+
+
+def _letter_weights():
+    weights = 1 / np.arange(1, len(LETTERS) + 1)
+    return weights / weights.sum()
+
+
+def recorded_categories(path):
+    with open(path, encoding="utf-8") as f:
+        recording = json.load(f)
+    stop_words = wiki.get_stop_words()
+    categories = {}
+    for category, texts in recording.items():
+        freq = Counter()
+        for text in texts.values():
+            freq.update(wiki.count_page_words(text, stop_words))
+        categories[category] = freq
+    return categories
+
+
+def traced(fn):
+    """Run fn; return (result, bytes it left allocated, seconds)."""
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - start
+    allocated, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, allocated, elapsed
+
+
+def best_of(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--categories", type=int, default=40)
+    parser.add_argument("--words", type=int, default=20000)
+    parser.add_argument("--recording", help="use the categories recorded here")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    if args.recording:
+        categories = recorded_categories(args.recording)
+    else:
+        categories = synthetic_categories(args.categories, args.words)
+    distinct = sum(map(len, categories.values()))
+    print(f"{len(categories)} categories, {distinct:,} category words")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        wiki_cache_utils.CACHE_DIR = tmp
+        json_bytes = 0
+        for category, freq in categories.items():
+            result = {"freq": freq.most_common()}
+            wiki_cache_utils.save_cache(wiki_cache_utils._key("json", category), result)
+            json_bytes += len(json.dumps(result, separators=(",", ":")).encode())
+            wiki_cache_utils.save_result_cache(category, freq)
+        store = wiki_freq_store.store_dir()
+        npy_bytes = sum(
+            os.path.getsize(os.path.join(store, name)) for name in os.listdir(store)
+        )
+
+        # In memory: every category loaded, in a fresh vocabulary
+        def load_json():
+            return [
+                wiki_cache_utils.load_cache(wiki_cache_utils._key("json", c))
+                for c in categories
+            ]
+
+        def load_tables():
+            wiki_freq_store._vocabularies.clear()
+            tables = [wiki_cache_utils.load_result_cache(c) for c in categories]
+            tables[0].vocabulary.refresh()
+            return tables
+
+        loaded, json_memory, json_seconds = traced(load_json)
+        tables, table_memory, table_seconds = traced(load_tables)
+        mapped = sum(table.nbytes() for table in tables)
+
+        for table, result, freq in zip(tables, loaded, categories.values()):
+            assert dict(table) == freq == dict(result["freq"]), "counts differ"
+            assert np.all(np.diff(table.counts.astype(np.int64)) <= 0), "not sorted"
+
+        print(f"\n{'':<22} {'JSON':>12} {'NumPy':>12} {'ratio':>7}")
+        rows = [
+            ("on disk (MiB)", json_bytes, npy_bytes),
+            ("in memory (MiB)", json_memory, table_memory),
+        ]
+        for label, old, new in rows:
+            print(f"{label:<22} {old / 1024**2:>12.2f} {new / 1024**2:>12.2f}", end="")
+            print(f" {old / new:>6.1f}x")
+        print(f"{'load all (ms)':<22} {json_seconds * 1000:>12.1f}", end="")
+        print(f" {table_seconds * 1000:>12.1f}")
+        print(f"(tables map {mapped / 1024**2:.2f} MiB of records, paged in on use)")
+
+        first = next(iter(categories))
+        key = wiki_cache_utils._key("json", first)
+        json_top = best_of(
+            lambda: wiki_cache_utils.load_cache(key)["freq"][:300], args.repeat
+        )
+        table_top = best_of(
+            lambda: wiki_cache_utils.load_result_cache(first).most_common(300),
+            args.repeat,
+        )
+        print(
+            f"{'top 300 (ms)':<22} {json_top * 1000:>12.2f} "
+            f"{table_top * 1000:>12.2f}"
+        )
+
+        expected = sum(categories.values(), Counter())
+        merged = wiki_freq_store.merge(tables)
+        assert dict(merged) == expected, "merged counts differ"
+        top = wiki_freq_store.merge(tables, n=300).most_common()
+        assert [c for _, c in top] == [c for _, c in expected.most_common(300)]
+        counter_merge = best_of(
+            lambda: sum((Counter(dict(r["freq"])) for r in loaded), Counter()),
+            args.repeat,
+        )
+        table_merge = best_of(lambda: wiki_freq_store.merge(tables, n=300), args.repeat)
+        print(
+            f"{'merge all (ms)':<22} {counter_merge * 1000:>12.1f} "
+            f"{table_merge * 1000:>12.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""Measure incremental category updates and check them against a full recount.
+
+Each round edits some pages and moves some in or out of the category on the
+fake MediaWiki API, updates the stored counts, and asserts that the result is
+exactly what counting every current page from scratch gives.
+
+    python bench_incremental.py --pages 2000
+"""
+
+import argparse
+import tempfile
+import time
+from collections import Counter
+
+import wiki_cache_utils
+import wiki_category_word_freq as wiki
+from fake_mediawiki import FakeMediaWiki
+
+
+def full_recount(category, stop_words):
+    freq = Counter()
+    for page, text in wiki.iter_pages_text(wiki.get_category_pages(category)):
+        freq.update(wiki.count_page_words(text, stop_words))
+    return freq
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, default=2000)
+    parser.add_argument("--changed", type=float, nargs="+", default=[0.0, 0.01, 0.1])
+    args = parser.parse_args()
+    category = f"Synthetic_{args.pages}"
+
+    stop_words = wiki.get_stop_words()
+    # Pages are tokenized in worker processes, so they are counted from the
+    # progress the update reports rather than in this process
+    tokenized = 0
+
+    def progress(pages_tokenized=None, **counts):
+        nonlocal tokenized
+        if pages_tokenized is not None:
+            tokenized = pages_tokenized
+
+    with FakeMediaWiki() as fake, tempfile.TemporaryDirectory() as cache_dir:
+        wiki.API_URL = fake.url
+        wiki_cache_utils.CACHE_DIR = cache_dir
+        titles = fake.page_titles(category)
+
+        print(f"{'changed':>8} {'tokenized':>10} {'update s':>9}  exact")
+        for round_, fraction in enumerate([1.0] + args.changed):
+            if round_:
+                n = int(len(titles) * fraction)
+                for title in titles[:n]:
+                    fake.edit(title)
+                # Swap a slice of pages out of (and the previous slice back into)
+                # the category.
+                fake.removed = set(titles[round_ * n : round_ * n + n // 2 + 1])
+            tokenized = 0
+            start = time.perf_counter()
+            freq = wiki.update_category_frequencies(category, progress=progress)
+            elapsed = time.perf_counter() - start
+            changed_pages = tokenized
+            exact = freq == full_recount(category, stop_words)
+            print(f"{fraction:>8.0%} {changed_pages:>10} {elapsed:>9.3f}  {exact}")
+            assert exact, "incremental counts diverged from a full recount"
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""Time the server-side word cloud layout against the number of words.
+
+Lays out the top N of a Zipf-distributed word list for several N (the
+browser cloud shows 150) on the default canvas. It checks that no two placed
+words' masks overlap, and reports layout and SVG rendering times, how many
+words fit, and the size of the SVG.
+
+    python bench_layout.py --words 25 50 100 150 300 --repeat 3
+"""
+
+import argparse
+import gzip
+import time
+
+import numpy as np
+
+import wiki_layout
+from color_palette import PastelPalette
+from fake_mediawiki import VOCABULARY
+
+
+def synthetic_words(n, seed=0):
+    rng = np.random.default_rng(seed)
+    words = list(dict.fromkeys(VOCABULARY))
+    suffixes = ("ism", "ology", "ic", "al", "ness", "ist", "ize", "ment")
+    words += [f"{a}{b}" for a in VOCABULARY for b in suffixes]
+    counts = sorted((rng.zipf(1.5, len(words)) * 10).tolist(), reverse=True)
+    return list(zip(words, counts))[:n]
+
+
+def check_no_overlap(placed, width, height):
+    rows, cols = -(-height // wiki_layout.CELL), -(-width // wiki_layout.CELL)
+    cover = np.zeros((rows, cols), dtype=np.int32)
+    for word in placed:
+        mask, (anchor_row, anchor_col) = wiki_layout.word_mask(
+            word["text"], word["size"], word["rotate"], bold=word["size"] > 30
+        )
+        top = word["y"] // wiki_layout.CELL - anchor_row
+        left = word["x"] // wiki_layout.CELL - anchor_col
+        assert top >= 0 and left >= 0, f"{word['text']} is off the canvas"
+        cover[top : top + mask.shape[0], left : left + mask.shape[1]] += mask
+    assert cover.max() <= 1, "words overlap"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--words", type=int, nargs="+", default=[25, 50, 100, 150, 300])
+    parser.add_argument("--width", type=int, default=wiki_layout.WIDTH)
+    parser.add_argument("--height", type=int, default=wiki_layout.HEIGHT)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(
+        f"{'words':>6} {'placed':>7} {'layout ms':>10} {'svg ms':>7} "
+        f"{'svg KiB':>8} {'gzip KiB':>9}"
+    )
+    for n in args.words:
+        words = synthetic_words(n)
+        times = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            placed = wiki_layout.layout(words, args.width, args.height, max_words=n)
+            times.append(time.perf_counter() - start)
+        check_no_overlap(placed, args.width, args.height)
+        start = time.perf_counter()
+        svg = wiki_layout.render_svg(placed, PastelPalette(), args.width, args.height)
+        render = time.perf_counter() - start
+        data = svg.encode()
+        print(
+            f"{len(words):>6} {len(placed):>7} {min(times) * 1000:>10.1f} "
+            f"{render * 1000:>7.2f} {len(data) / 1024:>8.1f} "
+            f"{len(gzip.compress(data)) / 1024:>9.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""Compare peak memory of the old collect-then-count pipeline with streaming.
+
+Both pipelines count the same synthetic corpus with the same tokenizer; only
+how pages flow through them differs. The streaming side is the real
+`update_category_frequencies`, listing a category from the fake MediaWiki API
+and tokenizing in this process, with page texts generated as they are
+fetched. Peak allocations are measured with tracemalloc.
+
+Without NLTK's data (offline, say), both sides use the regex tokenizer and
+the filler words of the synthetic corpus as stop words.
+
+    python bench_memory.py --pages 2000 --words-per-page 2000
+    python bench_memory.py --tokenizer regex
+"""
+
+import argparse
+import random
+import tempfile
+import time
+import tracemalloc
+from collections import Counter
+from itertools import product
+
+import wiki_cache_utils
+import wiki_category_word_freq as wiki
+from fake_mediawiki import FILLER, VOCABULARY, FakeMediaWiki
+
+
+def synthetic_pages(n, words_per_page):
+    """Yield n pages lazily, as a fetcher would."""
+    rng = random.Random(0)
+    # Sprinkle in rare words so the vocabulary grows with the corpus.
+    rare = ["".join(letters) for letters in product("etaoinshrd", repeat=4)]
+    vocabulary = VOCABULARY * 40 + FILLER * 40 + rare
+    for _ in range(n):
+        yield " ".join(rng.choices(vocabulary, k=words_per_page)) + "."
+
+
+def collect_then_count(args, tokenizer):
+    """The original main(): keep every text, then every token, then count."""
+    all_text = list(synthetic_pages(args.pages, args.words_per_page))
+    stop_words = wiki.get_stop_words()
+    words = []
+    for text in all_text:
+        words.extend(wiki.iter_page_words(text, stop_words, tokenizer))
+    return Counter(words)
+
+
+def streaming_count(args, tokenizer):
+    """update_category_frequencies: fetch -> tokenize -> count, page by page."""
+
+    def fetch_texts(pages):
+        return zip(pages, synthetic_pages(len(pages), args.words_per_page))
+
+    return wiki.update_category_frequencies(
+        f"Synthetic_{args.pages}", fetch_texts, workers=1, tokenizer=tokenizer
+    )
+
+
+def measure(pipeline, args, tokenizer):
+    tracemalloc.start()
+    start = time.perf_counter()
+    freq = pipeline(args, tokenizer)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return freq, peak, elapsed
+
+
+def nltk_available():
+    try:
+        wiki.warm_up("nltk")
+    except LookupError:
+        return False
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, default=2000)
+    parser.add_argument("--words-per-page", type=int, default=2000)
+    parser.add_argument(
+        "--tokenizer",
+        choices=wiki.TOKENIZERS,
+        help="default: nltk, or regex when NLTK's data can't be loaded",
+    )
+    args = parser.parse_args()
+
+    tokenizer = args.tokenizer
+    if not nltk_available():
+        if tokenizer == "nltk":
+            parser.error("the nltk tokenizer needs NLTK's punkt and stopwords data")
+        print("NLTK data unavailable: regex tokenizer, filler words as stop words")
+        tokenizer = "regex"
+        wiki._stop_words = frozenset(FILLER)
+    tokenizer = tokenizer or "nltk"
+
+    print(f"{args.pages} pages x {args.words_per_page} words, {tokenizer} tokenizer")
+    print(f"{'pipeline':<20} {'peak MiB':>9} {'seconds':>8}")
+    results = []
+    with FakeMediaWiki() as fake, tempfile.TemporaryDirectory() as cache_dir:
+        wiki.API_URL = fake.url
+        wiki_cache_utils.CACHE_DIR = cache_dir
+        for pipeline in (collect_then_count, streaming_count):
+            freq, peak, elapsed = measure(pipeline, args, tokenizer)
+            results.append(freq)
+            print(f"{pipeline.__name__:<20} {peak / 2**20:>9.1f} {elapsed:>8.2f}")
+    assert results[0] == results[1], "pipelines disagree"
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""Compare reading the top k words of large results: JSON against the NumPy store.
+
+For each size, a synthetic category of that many distinct words is stored
+three ways and its top k words are read back. Each read runs in a fresh
+interpreter, the way a newly started worker serves its first request.
+
+- json: the indented `{word: count}` file the app and CLI used to write,
+  loaded whole with `json.load`.
+- table+vocab: the memory-mapped id/count table, with the whole shared
+  vocabulary read to turn ids into words (what happened before the vocabulary
+  index).
+- load_top: `wiki_cache_utils.load_result_top`, which reads k records and
+  the k words they point at through the vocabulary index.
+
+Reports the time to the top k and how much the process's peak RSS grew
+(from /proc, so Linux only). The three readers must return the same counts.
+
+    python bench_result_format.py --words 100000 1000000 --k 300
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+READ = """
+import json, sys, time
+import numpy
+import wiki_cache_utils
+
+def peak_rss_kib():
+    # Not ru_maxrss: on Linux it carries over the parent's peak through exec
+    with open("/proc/self/status") as f:
+        return int(next(line for line in f if line.startswith("VmHWM")).split()[1])
+
+reader, path, cache_dir, k = sys.argv[1], sys.argv[2], sys.argv[3], int(sys.argv[4])
+wiki_cache_utils.CACHE_DIR = cache_dir
+before = peak_rss_kib()
+start = time.perf_counter()
+if reader == "json":
+    with open(path) as f:
+        top = list(json.load(f).items())[:k]
+elif reader == "table+vocab":
+    table = wiki_cache_utils.load_result_cache("large")
+    table.vocabulary.refresh()
+    top = table.most_common(k)
+else:
+    top = wiki_cache_utils.load_result_top("large", k)
+elapsed = time.perf_counter() - start
+grown = peak_rss_kib() - before
+counts = [count for _, count in top]
+print(json.dumps({"ms": elapsed * 1000, "rss_kib": grown, "counts": counts}))
+"""
+READERS = ("json", "table+vocab", "load_top")
+
+
+def synthetic_counts(words, seed=0):
+    """`words` distinct made-up words with Zipf-like counts, most common first."""
+    rng = np.random.default_rng(seed)
+    letters = np.array(list("etaoinshrdlcumwfgypbvkjxqz"))
+    # Distinct by construction: the base-26 digits of a shuffled range
+    numbers = rng.permutation(words) + 26**2
+    digits = np.stack([numbers // 26**i % 26 for i in range(6)], axis=1)
+    vocabulary = ["".join(row).rstrip("e") or "e" for row in letters[digits]]
+    vocabulary = list(dict.fromkeys(vocabulary))
+    counts = np.maximum(1, (1e6 / np.arange(1, len(vocabulary) + 1) ** 1.1)).astype(int)
+    return dict(zip(vocabulary, counts.tolist()))
+
+
+def read(reader, path, cache_dir, k):
+    result = subprocess.run(
+        [sys.executable, "-c", READ, reader, path, cache_dir, str(k)],
+        cwd=HERE,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(result.stdout)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--words", type=int, nargs="+", default=[100000, 1000000])
+    parser.add_argument("--k", type=int, default=300)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    import wiki_cache_utils
+    import wiki_freq_store
+
+    print(
+        f"{'words':>9} {'reader':<12} {'file MiB':>9} {'top-k ms':>9} "
+        f"{'RSS +MiB':>9}"
+    )
+    for words in args.words:
+        freq = synthetic_counts(words)
+        with tempfile.TemporaryDirectory() as tmp:
+            wiki_cache_utils.CACHE_DIR = tmp
+            wiki_freq_store._vocabularies.clear()
+            path = os.path.join(tmp, "large_freq.json")
+            with open(path, "w") as f:
+                json.dump(freq, f, indent=2)
+            wiki_cache_utils.save_result_cache("large", freq)
+            sizes = {
+                "json": os.path.getsize(path),
+                "table+vocab": sum(
+                    os.path.getsize(os.path.join(wiki_freq_store.store_dir(), name))
+                    for name in os.listdir(wiki_freq_store.store_dir())
+                ),
+            }
+            sizes["load_top"] = sizes["table+vocab"]
+            expected = sorted(freq.values(), reverse=True)[: args.k]
+            for reader in READERS:
+                runs = [read(reader, path, tmp, args.k) for _ in range(args.repeat)]
+                assert all(run["counts"] == expected for run in runs), reader
+                best = min(runs, key=lambda run: run["ms"])
+                print(
+                    f"{len(freq):>9,} {reader:<12} {sizes[reader] / 1024**2:>9.2f} "
+                    f"{best['ms']:>9.2f} {best['rss_kib'] / 1024:>9.2f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
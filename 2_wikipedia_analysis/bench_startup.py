@@ -0,0 +1,107 @@
+"""Measure how long the web app takes to import and to serve its first pages.
+
+Each run starts a fresh interpreter with `python -X importtime`, so the
+numbers include everything `import app` pulls in. It also checks that the
+page and /palettes are served without importing NLTK, requests or aiohttp.
+With --budget-ms the exit status is non-zero when the median import time is
+over budget, for tracking regressions.
+
+    python bench_startup.py --runs 5 --budget-ms 400
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+HEAVY_MODULES = ("nltk", "requests", "aiohttp")
+
+FIRST_REQUESTS = f"""
+import json, sys, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+client = app.app.test_client()
+assert client.get("/").status_code == 200
+assert client.get("/palettes").status_code == 200
+served = time.perf_counter()
+print(json.dumps({{
+    "import_ms": (imported - start) * 1000,
+    "first_requests_ms": (served - imported) * 1000,
+    "heavy_modules_loaded": [m for m in {HEAVY_MODULES!r} if m in sys.modules],
+}}))
+"""
+
+
+def import_times(module):
+    """Import `module` in a fresh interpreter; return {name: (self_us, total_us)}."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=HERE,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line.split(":", 1)[1].split("|")
+        times[name.strip()] = (int(self_us), int(cumulative_us))
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--module", default="app")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--budget-ms", type=float, default=None)
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    runs = [import_times(args.module) for _ in range(args.runs)]
+    totals = [times[args.module][1] / 1000 for times in runs]
+    median = statistics.median(totals)
+    print(f"import {args.module}: median {median:.1f} ms over {args.runs} runs")
+    print("\nslowest imports (cumulative, last run):")
+    slowest = sorted(runs[-1].items(), key=lambda item: -item[1][1])
+    for name, (self_us, cumulative_us) in slowest[: args.top]:
+        print(f"  {cumulative_us / 1000:>8.1f} ms  {name.lstrip()}")
+
+    first = subprocess.run(
+        [sys.executable, "-c", FIRST_REQUESTS],
+        cwd=HERE,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    startup = json.loads(first.stdout.splitlines()[-1])
+    served_ms = startup["first_requests_ms"]
+    print(f"\n/ and /palettes served {served_ms:.1f} ms after import")
+    loaded = startup["heavy_modules_loaded"]
+    print(f"heavy modules loaded: {', '.join(loaded) or 'none'}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(
+                {
+                    "module": args.module,
+                    "import_ms": totals,
+                    "median_import_ms": median,
+                    **startup,
+                },
+                f,
+                indent=2,
+            )
+    if loaded:
+        sys.exit(f"{', '.join(loaded)} imported before any crawl")
+    if args.budget_ms is not None and median > args.budget_ms:
+        sys.exit(f"import took {median:.1f} ms, over the {args.budget_ms:g} ms budget")
+
+
+if __name__ == "__main__":
+    main()
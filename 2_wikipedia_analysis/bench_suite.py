@@ -0,0 +1,261 @@
+"""Benchmark the whole pipeline against the fake MediaWiki API.
+
+For small, medium and huge synthetic categories (and any recorded ones),
+times each stage on its own: listing the category, fetching texts,
+tokenizing, counting, page cache writes and reads, and /wordcloud requests
+(cold, from the stored result, from the in-memory cache, gzip-encoded, and
+revalidated with If-None-Match). Each stage reports throughput and p50/p99
+latency of its unit of work; the results are written as JSON, and --compare
+prints the change from an earlier run.
+
+    python bench_suite.py --output results.json
+    python bench_suite.py --sizes small=20 medium=500 --compare results.json
+    python bench_suite.py --recording fixtures/llm.json --sizes
+"""
+
+import argparse
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import app
+import wiki_cache_utils
+import wiki_category_word_freq as wiki
+from fake_mediawiki import FakeMediaWiki
+
+DEFAULT_SIZES = ["small=20", "medium=500", "huge=5000"]
+
+
+def percentile(samples, q):
+    """Nearest-rank percentile of `samples`."""
+    ordered = sorted(samples)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+
+def summarize(latencies, items, elapsed):
+    """Stage result: `latencies` (s) of each unit of work covering `items` pages."""
+    return {
+        "ops": len(latencies),
+        "items": items,
+        "seconds": elapsed,
+        "items_per_s": items / elapsed if elapsed else None,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+    }
+
+
+def timed(fn, args):
+    """Run fn on each argument; return (results, latencies, elapsed)."""
+    results, latencies = [], []
+    start = time.perf_counter()
+    for arg in args:
+        op_start = time.perf_counter()
+        results.append(fn(arg))
+        latencies.append(time.perf_counter() - op_start)
+    return results, latencies, time.perf_counter() - start
+
+
+def fresh_cache():
+    cache_dir = tempfile.mkdtemp(prefix="wiki-bench-")
+    wiki_cache_utils.CACHE_DIR = cache_dir
+    return cache_dir
+
+
+def run_category(category, args, client, response_cache):
+    stages = {}
+    stop_words = wiki.get_stop_words()
+    fresh_cache()
+
+    listings, latencies, elapsed = timed(
+        lambda _: wiki.get_category_pages(category), range(args.repeat)
+    )
+    pages = listings[-1]
+    stages["list"] = summarize(latencies, len(pages) * args.repeat, elapsed)
+
+    latencies, texts = [], {}
+
+    def fetch(pageid):
+        start = time.perf_counter()
+        texts[pageid] = wiki.get_page_text_by_id(pageid)
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(args.concurrency) as executor:
+        list(executor.map(fetch, [page["pageid"] for page in pages]))
+    stages["fetch"] = summarize(latencies, len(pages), time.perf_counter() - start)
+
+    items = [(page, texts[page["pageid"]]) for page in pages]
+    words, latencies, elapsed = timed(
+        lambda item: list(wiki.iter_page_words(item[1], stop_words, args.tokenizer)),
+        items,
+    )
+    stages["tokenize"] = summarize(latencies, len(items), elapsed)
+
+    freq = Counter()
+    _, latencies, elapsed = timed(freq.update, map(Counter, words))
+    stages["count"] = summarize(latencies, len(items), elapsed)
+
+    def write(item):
+        page, text = item
+        wiki_cache_utils.save_page_cache(
+            page["pageid"], page["lastrevid"], page["title"], text
+        )
+
+    _, latencies, elapsed = timed(write, items)
+    stages["cache_write"] = summarize(latencies, len(items), elapsed)
+
+    def read(page):
+        return wiki_cache_utils.load_page_cache(page["pageid"], page["lastrevid"])
+
+    cached, latencies, elapsed = timed(read, pages)
+    assert all(text is not None for text in cached), "page cache lost an entry"
+    stages["cache_read"] = summarize(latencies, len(pages), elapsed)
+
+    # /wordcloud: a crawl into an empty cache, then the stored result with the
+    # in-memory cache cleared each time, then in-memory hits.
+    url = f"/wordcloud?category={category}"
+
+    def get(_, headers=None, status=200):
+        response = client.get(url, headers=headers)
+        assert response.status_code == status, response.status_code
+        return response
+
+    fresh_cache()
+    response_cache.discard(category)
+    _, latencies, elapsed = timed(get, range(1))
+    stages["wordcloud_cold"] = summarize(latencies, len(pages), elapsed)
+
+    def get_stored(_):
+        response_cache.discard(category)
+        return get(_)
+
+    _, latencies, elapsed = timed(get_stored, range(args.repeat))
+    stages["wordcloud_stored"] = summarize(latencies, args.repeat, elapsed)
+    _, latencies, elapsed = timed(get, range(args.repeat))
+    stages["wordcloud_memory"] = summarize(latencies, args.repeat, elapsed)
+
+    # Precompressed bodies, and revalidation of a body the client already has
+    gzip = {"Accept-Encoding": "gzip"}
+    responses, latencies, elapsed = timed(lambda _: get(_, gzip), range(args.repeat))
+    stages["wordcloud_gzip"] = summarize(latencies, args.repeat, elapsed)
+    revalidate = {**gzip, "If-None-Match": responses[-1].headers["ETag"]}
+    _, latencies, elapsed = timed(
+        lambda _: get(_, revalidate, status=304), range(args.repeat)
+    )
+    stages["wordcloud_304"] = summarize(latencies, args.repeat, elapsed)
+    stages["wordcloud_gzip"]["bytes"] = len(responses[-1].data)
+    stages["wordcloud_memory"]["bytes"] = len(get(None).data)
+    return {"pages": len(pages), "stages": stages}
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(results, baseline=None):
+    print(
+        f"{'category':<10} {'stage':<17} {'ops':>6} {'items/s':>10} "
+        f"{'p50 ms':>9} {'p99 ms':>9}"
+    )
+    for label, result in results["categories"].items():
+        for stage, r in result["stages"].items():
+            line = (
+                f"{label:<10} {stage:<17} {r['ops']:>6} {r['items_per_s']:>10.1f} "
+                f"{r['p50_ms']:>9.2f} {r['p99_ms']:>9.2f}"
+            )
+            old = baseline and baseline["categories"].get(label, {})
+            old = old and old["stages"].get(stage)
+            if old:
+                line += (
+                    f"  p50 {r['p50_ms'] / old['p50_ms']:.2f}x,"
+                    f" items/s {r['items_per_s'] / old['items_per_s']:.2f}x"
+                )
+            print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        "--sizes",
+        nargs="*",
+        default=DEFAULT_SIZES,
+        metavar="LABEL=PAGES",
+        help=f"synthetic categories to run (default: {' '.join(DEFAULT_SIZES)})",
+    )
+    parser.add_argument("--recording", help="also run the categories recorded here")
+    parser.add_argument("--latency", type=float, default=0.01)
+    parser.add_argument("--words-per-page", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--tokenizer", choices=wiki.TOKENIZERS, default="regex")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="an earlier results file to compare with")
+    args = parser.parse_args()
+    # /wordcloud counts with the default tokenizer.
+    wiki.DEFAULT_TOKENIZER = args.tokenizer
+
+    categories = {}
+    for size in args.sizes:
+        label, pages = size.split("=")
+        categories[label] = f"Synthetic_{pages}"
+
+    wiki.warm_up(args.tokenizer)
+    results = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "revision": git_revision(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "settings": {
+            key: getattr(args, key)
+            for key in (
+                "latency",
+                "words_per_page",
+                "concurrency",
+                "repeat",
+                "tokenizer",
+            )
+        },
+        "categories": {},
+    }
+    fake = FakeMediaWiki(latency=args.latency, words_per_page=args.words_per_page)
+    with fake:
+        if args.recording:
+            fake.load_recording(args.recording)
+            categories.update((category, category) for category in fake.recorded)
+        wiki.API_URL = fake.url
+        client = app.app.test_client()
+        for label, category in categories.items():
+            print(f"Running {label} ({category})...", file=sys.stderr)
+            results["categories"][label] = run_category(
+                category, args, client, app.response_cache
+            )
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""Measure tokenization throughput as the number of worker processes grows.
+
+    python bench_tokenize.py --pages 2000 --words-per-page 2000
+"""
+
+import argparse
+import os
+import time
+from collections import Counter
+
+import wiki_category_word_freq as wiki
+from bench_memory import synthetic_pages
+
+
+def run(pages, words_per_page, workers, tokenizer):
+    texts = (
+        ({"title": f"page {i}"}, text)
+        for i, text in enumerate(synthetic_pages(pages, words_per_page))
+    )
+    freq = Counter()
+    for _, counts in wiki.iter_page_counts(texts, pages, workers, tokenizer):
+        freq.update(counts)
+    return freq
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, default=2000)
+    parser.add_argument("--words-per-page", type=int, default=2000)
+    parser.add_argument("--workers", type=int, nargs="+", default=None)
+    parser.add_argument("--tokenizer", choices=wiki.TOKENIZERS, default="nltk")
+    args = parser.parse_args()
+    cores = os.cpu_count() or 1
+    workers = args.workers or sorted({1, 2, 4, 8, cores} & set(range(1, cores + 1)))
+
+    wiki.warm_up(args.tokenizer)
+    print(f"{args.pages} pages x {args.words_per_page} words, {cores} cores")
+    print(f"{'workers':>7} {'seconds':>8} {'pages/s':>9} {'speedup':>8}")
+    baseline = expected = None
+    for n in workers:
+        start = time.perf_counter()
+        freq = run(args.pages, args.words_per_page, n, args.tokenizer)
+        elapsed = time.perf_counter() - start
+        baseline = baseline or elapsed
+        expected = expected or freq
+        assert freq == expected, "parallel counts differ from serial counts"
+        print(
+            f"{n:>7} {elapsed:>8.2f} {args.pages / elapsed:>9.1f} "
+            f"{baseline / elapsed:>7.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""Check the regex tokenizer against NLTK and compare their throughput.
+
+The differential check compares the lowercase alphabetic tokens the regex
+tokenizer keeps with NLTK's for the same text; any difference is listed and
+makes the script exit with status 1. For the fixture corpus, NLTK's counts
+are stored in `fixtures/tokenizer_corpus.nltk.json`, so the check runs
+without NLTK's punkt data. When the data is there, NLTK is run as well and
+must agree with the stored counts; --update-golden rewrites them from it.
+Other corpora need the data.
+
+    python bench_tokenizers.py [--repeat 200] [extra_corpus.txt ...]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from collections import Counter
+
+import wiki_category_word_freq as wiki
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+FIXTURE = os.path.join(FIXTURES, "tokenizer_corpus.txt")
+GOLDEN = os.path.join(FIXTURES, "tokenizer_corpus.nltk.json")
+
+
+def alphabetic_tokens(text, tokenizer):
+    # An empty stopword set keeps every alphabetic token.
+    return Counter(wiki.iter_page_words(text, frozenset(), tokenizer))
+
+
+def load_golden():
+    with open(GOLDEN, encoding="utf-8") as f:
+        return Counter(json.load(f))
+
+
+def save_golden(counts):
+    with open(GOLDEN, "w", encoding="utf-8") as f:
+        json.dump(dict(counts.most_common()), f, indent=1, ensure_ascii=False)
+        f.write("\n")
+
+
+def nltk_available():
+    try:
+        wiki.warm_up("nltk")
+    except LookupError:
+        return False
+    return True
+
+
+def compare(expected, text):
+    actual = alphabetic_tokens(text, "regex")
+    return expected - actual, actual - expected
+
+
+def throughput(text, tokenizer, repeat):
+    start = time.perf_counter()
+    tokens = 0
+    for _ in range(repeat):
+        for _ in wiki.iter_page_words(text, frozenset(), tokenizer):
+            tokens += 1
+    return tokens / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("corpus", nargs="*", default=[FIXTURE])
+    parser.add_argument("--repeat", type=int, default=200)
+    parser.add_argument(
+        "--update-golden",
+        action="store_true",
+        help="store NLTK's counts for the fixture corpus (needs punkt data)",
+    )
+    args = parser.parse_args()
+
+    text = "\n\n".join(open(path, encoding="utf-8").read() for path in args.corpus)
+    live = nltk_available()
+    if live:
+        expected = alphabetic_tokens(text, "nltk")
+    elif args.corpus == [FIXTURE] and not args.update_golden:
+        print("NLTK data unavailable: checking against the stored NLTK counts")
+        expected = None
+    else:
+        sys.exit("NLTK's punkt and stopwords data are needed for this corpus")
+    if args.corpus == [FIXTURE]:
+        if args.update_golden:
+            save_golden(expected)
+            print(f"Stored NLTK's counts in {GOLDEN}")
+        golden = load_golden()
+        if expected is not None and expected != golden:
+            sys.exit(f"NLTK disagrees with {GOLDEN}: rerun with --update-golden")
+        expected = golden
+
+    missing, extra = compare(expected, text)
+    total = sum(expected.values())
+    differing = sum(missing.values()) + sum(extra.values())
+    print(f"{total} alphabetic tokens, {differing} differ between backends")
+    for word, count in missing.most_common():
+        print(f"  only nltk:  {word} x{count}")
+    for word, count in extra.most_common():
+        print(f"  only regex: {word} x{count}")
+
+    print(f"\n{'tokenizer':<10} {'tokens/s':>12}")
+    for tokenizer in wiki.TOKENIZERS if live else ["regex"]:
+        print(f"{tokenizer:<10} {throughput(text, tokenizer, args.repeat):>12,.0f}")
+
+    if differing:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""Check approximate top-k counting against exact counts, and compare their cost.
+
+Counts a synthetic crawl (Zipf-distributed words whose vocabulary keeps
+growing with the corpus, like a large recursive or dump crawl) exactly with a
+Counter and with `TopWords` summaries of several capacities, both in one pass
+and as parallel shards merged at the end. For every summary the top 300 are
+checked: each count is low by no more than the stated error, the error is
+within the guaranteed bound, and no word left out could beat the ones kept.
+Reports peak memory (tracemalloc) and throughput of each.
+
+    python bench_topk.py --pages 5000 --capacity 1000 5000 20000
+"""
+
+import argparse
+import time
+import tracemalloc
+from collections import Counter
+
+import numpy as np
+
+from wiki_topk import TopWords
+
+TOP = 300
+
+
+def synthetic_pages(n, words_per_page, seed=0):
+    """Per-page Counters, as the tokenizer workers return them."""
+    rng = np.random.default_rng(seed)
+    pages = []
+    for _ in range(n):
+        ids, counts = np.unique(rng.zipf(1.2, size=words_per_page), return_counts=True)
+        pages.append(Counter(dict(zip((f"w{i}" for i in ids), counts.tolist()))))
+    return pages
+
+
+def measure(count, pages):
+    """Run count(pages); return (result, peak bytes, words per second)."""
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = count(pages)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    words = sum(sum(page.values()) for page in pages)
+    return result, peak, words / elapsed
+
+
+def exact(pages):
+    freq = Counter()
+    for page in pages:
+        freq.update(page)
+    return freq
+
+
+def approximate(capacity, shards=1):
+    def count(pages):
+        summaries = [TopWords(capacity) for _ in range(shards)]
+        for i, page in enumerate(pages):
+            summaries[i % shards].update(page)
+        for summary in summaries[1:]:
+            summaries[0].merge(summary)
+        return summaries[0]
+
+    return count
+
+
+def check(summary, freq):
+    """Assert the summary's top words are within its stated error."""
+    assert summary.total == sum(freq.values()), "words lost"
+    assert summary.error <= summary.bound(), "error over the guaranteed bound"
+    top = summary.most_common(TOP)
+    for word, count in top:
+        assert 0 <= freq[word] - count <= summary.error, f"{word} off by too much"
+    # A word left out counted at most the last estimate kept, plus the error
+    last = top[-1][1]
+    kept = {word for word, _ in top}
+    for word, count in freq.most_common(TOP):
+        if word not in kept:
+            assert count <= last + summary.error, f"{word} should have been kept"
+    return max(freq[word] - count for word, count in top)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, default=5000)
+    parser.add_argument("--words-per-page", type=int, default=500)
+    parser.add_argument("--capacity", type=int, nargs="+", default=[1000, 5000, 20000])
+    parser.add_argument("--shards", type=int, default=4)
+    args = parser.parse_args()
+
+    pages = synthetic_pages(args.pages, args.words_per_page)
+    freq, peak, rate = measure(exact, pages)
+    total = sum(freq.values())
+    print(f"{args.pages} pages, {total:,} words, {len(freq):,} distinct")
+    print(
+        f"{'counter':<22} {'words kept':>10} {'peak MiB':>9} {'Mwords/s':>9} "
+        f"{'error':>7} {'bound':>7} {'max off':>7}"
+    )
+    print(f"{'Counter':<22} {len(freq):>10,} {peak / 1024**2:>9.2f} {rate / 1e6:>9.2f}")
+    for capacity in args.capacity:
+        for shards in (1, args.shards):
+            summary, peak, rate = measure(approximate(capacity, shards), pages)
+            off = check(summary, freq)
+            label = f"TopWords({capacity})" + (f" x{shards}" if shards > 1 else "")
+            print(
+                f"{label:<22} {len(summary):>10,} {peak / 1024**2:>9.2f} "
+                f"{rate / 1e6:>9.2f} {summary.error:>7} {summary.bound():>7} "
+                f"{off:>7}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""Fire parallel /wordcloud requests for one cold category and count upstream calls.
+
+Single-flight should collapse the concurrent misses into one crawl: the fake
+MediaWiki API must see exactly one category listing and one text fetch per
+page, however many requests arrive together.
+
+    python bench_wordcloud_load.py --requests 32 --pages 300
+"""
+
+import argparse
+import math
+import tempfile
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.serving import WSGIRequestHandler, make_server
+
+import wiki_cache_utils
+import wiki_category_word_freq as wiki
+from fake_mediawiki import FakeMediaWiki
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+def expected_calls(fake, pages):
+    return {
+        "info": math.ceil(pages / fake.members_per_response),
+        "extracts": pages,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=32)
+    parser.add_argument("--pages", type=int, default=300)
+    parser.add_argument("--latency", type=float, default=0.02)
+    args = parser.parse_args()
+    category = f"Synthetic_{args.pages}"
+
+    with FakeMediaWiki(latency=args.latency) as fake, tempfile.TemporaryDirectory() as cache_dir:
+        wiki.API_URL = fake.url
+        wiki_cache_utils.CACHE_DIR = cache_dir
+        from app import app
+
+        server = make_server(
+            "127.0.0.1", 0, app, threaded=True, request_handler=QuietHandler
+        )
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{server.server_port}/wordcloud?category={category}"
+
+        def fetch(_):
+            start = time.perf_counter()
+            with urllib.request.urlopen(url) as response:
+                return response.read(), time.perf_counter() - start
+
+        try:
+            with ThreadPoolExecutor(args.requests) as pool:
+                results = list(pool.map(fetch, range(args.requests)))
+            warm_body, warm_latency = fetch(None)
+        finally:
+            server.shutdown()
+
+    bodies = {body for body, _ in results}
+    latencies = sorted(latency for _, latency in results)
+    expected = expected_calls(fake, args.pages)
+    print(f"{args.requests} concurrent cold requests for {category}")
+    print(f"  distinct bodies:   {len(bodies)}")
+    print(f"  latency min/max:   {latencies[0]:.2f}s / {latencies[-1]:.2f}s")
+    print(f"  warm latency:      {warm_latency * 1000:.1f} ms")
+    for kind, count in expected.items():
+        print(f"  upstream {kind + ':':<10} {fake.calls[kind]} (one crawl = {count})")
+    assert bodies == {warm_body}, "requests got different responses"
+    assert all(fake.calls[kind] == count for kind, count in expected.items()), (
+        "upstream was crawled more than once"
+    )
+
+
+if __name__ == "__main__":
+    main()
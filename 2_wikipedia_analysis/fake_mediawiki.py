@@ -0,0 +1,307 @@
+"""A local stand-in for the MediaWiki API, for benchmarks and offline runs.
+
+Serves synthetic `list=categorymembers`, `generator=categorymembers&prop=info`, `prop=info&pageids=`
+and `prop=extracts` responses with a configurable per-request latency. Any
+category named `<prefix>_<N>` (e.g. `Synthetic_400`) has N deterministic
+article pages, plus the subcategories listed for it in `subcategories`;
+`edit()` and `removed` simulate revisions and membership changes, and
+`calls` counts requests by kind. Categories recorded from the real API with
+`--record` are served with their recorded articles instead. Like the real
+TextExtracts API, full-text extracts come one per response.
+
+    python fake_mediawiki.py --port 8765 --latency 0.05
+    WIKI_API_URL=http://127.0.0.1:8765/w/api.php python wiki_category_word_freq.py Synthetic_400
+
+    python fake_mediawiki.py --record Large_language_models --output fixtures/llm.json
+    python fake_mediawiki.py --recording fixtures/llm.json
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+import zlib
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+VOCABULARY = (
+    "energy matter quantum field particle wave theory motion force mass light "
+    "space time gravity atom electron photon relativity mechanics thermodynamics "
+    "entropy momentum velocity charge magnetic electric nuclear spin symmetry "
+    "model language neural network training data token transformer attention "
+    "learning parameter dataset benchmark inference layer gradient optimization"
+).split()
+FILLER = "the of and to in is was for on that with as by it are from".split()
+# TextExtracts returns one full-text extract per response; only intros
+# (`exintro`) come up to 20 at a time.
+INTRO_EXTRACTS_PER_RESPONSE = 20
+
+
+class FakeMediaWiki:
+    def __init__(
+        self,
+        latency=0.0,
+        words_per_page=400,
+        members_per_response=500,
+        extracts_per_response=1,
+        host="127.0.0.1",
+        port=0,
+    ):
+        self.latency = latency
+        self.words_per_page = words_per_page
+        self.members_per_response = members_per_response
+        self.extracts_per_response = extracts_per_response
+        self.request_count = 0
+        self.calls = Counter()
+        self.revisions = {}
+        self.removed = set()
+        self.subcategories = {}
+        self.recorded = {}
+        self._recorded_texts = {}
+        self._titles_by_id = {}
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/w/api.php"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def load_recording(self, path):
+        """Serve the categories saved by `record()` with their recorded pages."""
+        with open(path, encoding="utf-8") as f:
+            recording = json.load(f)
+        for category, texts in recording.items():
+            self.recorded[category] = list(texts)
+            self._recorded_texts.update(texts)
+
+    def category_size(self, category):
+        try:
+            return int(category.rsplit("_", 1)[1])
+        except (IndexError, ValueError):
+            return 0
+
+    def page_titles(self, category):
+        name = category.removeprefix("Category:")
+        if name in self.recorded:
+            titles = self.recorded[name]
+        else:
+            titles = [f"{name} page {i}" for i in range(self.category_size(name))]
+        titles = [title for title in titles if title not in self.removed]
+        with self._lock:
+            self._titles_by_id.update((self.page_id(t), t) for t in titles)
+        return titles
+
+    def page_id(self, title):
+        return zlib.crc32(title.encode()) & 0x7FFFFFFF
+
+    def last_revid(self, title):
+        revision = self.revisions.get(title, 1)
+        return zlib.crc32(f"{title}#{revision}".encode()) & 0x7FFFFFFF
+
+    def edit(self, title):
+        """Simulate an edit: bump the page's revision and change its text."""
+        self.revisions[title] = self.revisions.get(title, 1) + 1
+
+    def page_text(self, title):
+        if title in self._recorded_texts:
+            return self._recorded_texts[title]
+        rng = random.Random(f"{title}#{self.revisions.get(title, 1)}")
+        words = []
+        for _ in range(self.words_per_page):
+            pool = FILLER if rng.random() < 0.4 else VOCABULARY
+            words.append(rng.choice(pool))
+        sentences = [" ".join(words[i : i + 12]) for i in range(0, len(words), 12)]
+        return ". ".join(s.capitalize() for s in sentences) + "."
+
+    def categorymembers(self, params):
+        titles = self.page_titles(params["cmtitle"])
+        start = int(params.get("cmcontinue", 0))
+        limit = min(int(params.get("cmlimit", 10)), self.members_per_response)
+        end = start + limit
+        data = {
+            "query": {
+                "categorymembers": [
+                    {"pageid": self.page_id(t), "ns": 0, "title": t}
+                    for t in titles[start:end]
+                ]
+            }
+        }
+        if end < len(titles):
+            data["continue"] = {"cmcontinue": str(end), "continue": "-||"}
+        return data
+
+    def page_info(self, params):
+        name = params["gcmtitle"].removeprefix("Category:")
+        namespaces = params.get("gcmnamespace", "0|14").split("|")
+        members = []
+        if "0" in namespaces:
+            members += self.page_titles(name)
+        if "14" in namespaces:
+            members += [f"Category:{sub}" for sub in self.subcategories.get(name, [])]
+        start = int(params.get("gcmcontinue", 0))
+        limit = params.get("gcmlimit", 10)
+        limit = self.members_per_response if limit == "max" else int(limit)
+        end = start + min(limit, self.members_per_response)
+        data = {"query": {"pages": self.page_infos(members[start:end])}}
+        if end < len(members):
+            data["continue"] = {"gcmcontinue": str(end), "continue": "gcmcontinue||"}
+        return data
+
+    def page_infos(self, titles):
+        pages = {}
+        for title in titles:
+            pageid = self.page_id(title)
+            pages[str(pageid)] = {
+                "pageid": pageid,
+                "ns": 14 if title.startswith("Category:") else 0,
+                "title": title,
+                "lastrevid": self.last_revid(title),
+            }
+        return pages
+
+    def revisions_by_id(self, params):
+        ids = [int(pageid) for pageid in params["pageids"].split("|")]
+        titles = [self._titles_by_id[pageid] for pageid in ids]
+        pages = self.page_infos(t for t in titles if t not in self.removed)
+        for pageid in ids:
+            pages.setdefault(str(pageid), {"pageid": pageid, "missing": ""})
+        return {"query": {"pages": pages}}
+
+    def extracts(self, params):
+        if "pageids" in params:
+            ids = [int(pageid) for pageid in params["pageids"].split("|")]
+            titles = [self._titles_by_id[pageid] for pageid in ids]
+        else:
+            titles = params["titles"].split("|")
+        start = int(params.get("excontinue", 0))
+        if "exintro" in params:
+            end = start + INTRO_EXTRACTS_PER_RESPONSE
+        else:
+            end = start + self.extracts_per_response
+        pages = {}
+        for i, title in enumerate(titles):
+            page = {"pageid": self.page_id(title), "ns": 0, "title": title}
+            if start <= i < end:
+                page["extract"] = self.page_text(title)
+            pages[str(page["pageid"])] = page
+        data = {"query": {"pages": pages}}
+        if end < len(titles):
+            data["continue"] = {"excontinue": end, "continue": "||"}
+        return data
+
+    def respond(self, params):
+        if params.get("list") == "categorymembers":
+            kind, handler = "categorymembers", self.categorymembers
+        elif params.get("generator") == "categorymembers":
+            kind, handler = "info", self.page_info
+        elif params.get("prop") == "info":
+            kind, handler = "info_ids", self.revisions_by_id
+        elif params.get("prop") == "extracts":
+            kind, handler = "extracts", self.extracts
+        else:
+            return {"error": {"code": "badvalue", "info": "Unsupported query"}}
+        with self._lock:
+            self.calls[kind] += 1
+        return handler(params)
+
+    def _handler_class(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                with fake._lock:
+                    fake.request_count += 1
+                if fake.latency:
+                    time.sleep(fake.latency)
+                query = parse_qs(urlparse(self.path).query)
+                params = {k: v[-1] for k, v in query.items()}
+                body = json.dumps(fake.respond(params)).encode()
+                try:
+                    self.send_response(200)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                except (BrokenPipeError, ConnectionResetError):
+                    # The client gave up on this request (e.g. a cancelled crawl).
+                    pass
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def record(categories, path, max_pages=None):
+    """Save the article texts of real categories (from WIKI_API_URL) for replay."""
+    import wiki_category_word_freq as wiki
+
+    recording = {}
+    for category in categories:
+        pages = wiki.get_category_pages(category)[:max_pages]
+        texts = {}
+        for start in range(0, len(pages), wiki.MAX_TITLES_PER_QUERY):
+            batch = pages[start : start + wiki.MAX_TITLES_PER_QUERY]
+            texts.update(wiki.get_pages_text_by_id([page["pageid"] for page in batch]))
+        recording[category] = {page["title"]: texts[page["pageid"]] for page in pages}
+        print(f"Recorded {len(pages)} pages of {category}")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(recording, f, ensure_ascii=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a fake MediaWiki API server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--words-per-page", type=int, default=400)
+    parser.add_argument("--recording", help="also serve the categories in this file")
+    parser.add_argument(
+        "--record",
+        nargs="+",
+        metavar="CATEGORY",
+        help="record these categories from the real API instead of serving",
+    )
+    parser.add_argument("--output", default="recording.json")
+    parser.add_argument("--max-pages", type=int, default=None)
+    args = parser.parse_args()
+    if args.record:
+        record(args.record, args.output, args.max_pages)
+        return
+    fake = FakeMediaWiki(
+        latency=args.latency,
+        words_per_page=args.words_per_page,
+        host=args.host,
+        port=args.port,
+    )
+    if args.recording:
+        fake.load_recording(args.recording)
+    print(f"Serving fake MediaWiki API at {fake.url}")
+    try:
+        fake._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,280 @@
+import asyncio
+import collections
+import json
+import queue
+import random
+import threading
+import time
+
+import aiohttp
+
+import wiki_category_word_freq as wiki
+import wiki_metrics as metrics
+from wiki_cache_utils import save_page_cache
+
+DEFAULT_CONCURRENCY = 8
+# Ask replica-lagged servers to push back instead of serving us stale data.
+DEFAULT_MAXLAG = 5
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """Token-bucket rate limiter: `rate` requests/sec with bursts up to `capacity`."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.capacity, self.tokens + (now - self.updated) * self.rate
+                )
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class RetryLater(Exception):
+    def __init__(self, delay=None):
+        super().__init__(f"server asked to retry after {delay}s")
+        self.delay = delay
+
+
+def _retry_after(headers):
+    try:
+        return float(headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+
+class AsyncWikiClient:
+    """MediaWiki API client with bounded concurrency, rate limiting and retries."""
+
+    def __init__(
+        self,
+        session,
+        concurrency=DEFAULT_CONCURRENCY,
+        rate=None,
+        max_retries=5,
+        backoff=0.5,
+        maxlag=DEFAULT_MAXLAG,
+        api_url=None,
+    ):
+        self.session = session
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.bucket = TokenBucket(rate) if rate else None
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.maxlag = maxlag
+        self.api_url = api_url or wiki.API_URL
+
+    async def _get(self, params):
+        async with self.semaphore:
+            if self.bucket:
+                await self.bucket.acquire()
+            endpoint = wiki._api_endpoint(params)
+            start = time.perf_counter()
+            async with self.session.get(self.api_url, params=params) as response:
+                body = await response.read()
+                status = response.status
+                metrics.inc("wiki_api_requests_total", endpoint=endpoint, status=status)
+                metrics.inc("wiki_api_bytes_total", len(body), endpoint=endpoint)
+                metrics.observe(
+                    "wiki_api_request_seconds",
+                    time.perf_counter() - start,
+                    endpoint=endpoint,
+                )
+                if status in RETRY_STATUSES:
+                    raise RetryLater(_retry_after(response.headers))
+                response.raise_for_status()
+                data = json.loads(body)
+                if data.get("error", {}).get("code") == "maxlag":
+                    raise RetryLater(_retry_after(response.headers))
+                return data
+
+    async def query(self, params):
+        params = {"action": "query", "format": "json", **params}
+        if self.maxlag is not None:
+            params["maxlag"] = self.maxlag
+        # aiohttp only accepts str/int/float query values.
+        params = {k: ("1" if v is True else v) for k, v in params.items()}
+        for attempt in range(self.max_retries + 1):
+            try:
+                return await self._get(params)
+            except (RetryLater, aiohttp.ClientConnectionError) as e:
+                endpoint = wiki._api_endpoint(params)
+                reason = "retry later" if isinstance(e, RetryLater) else "connection"
+                metrics.inc("wiki_api_errors_total", endpoint=endpoint, reason=reason)
+                if attempt == self.max_retries:
+                    raise
+                metrics.inc("wiki_api_retries_total", endpoint=endpoint)
+                delay = self.backoff * 2**attempt * (1 + random.random())
+                if isinstance(e, RetryLater) and e.delay is not None:
+                    delay = max(delay, e.delay)
+                await asyncio.sleep(delay)
+
+    async def iter_category_pages(self, category):
+        """Yield batches of {pageid, title, lastrevid} as each listing page arrives."""
+        cont = {}
+        while True:
+            params = {
+                "generator": "categorymembers",
+                "gcmtitle": f"Category:{category}",
+                "gcmnamespace": 0,
+                "gcmlimit": "max",
+                "prop": "info",
+                **cont,
+            }
+            data = await self.query(params)
+            yield wiki._page_revisions(data)
+            cont = data.get("continue")
+            if not cont:
+                break
+
+    async def get_page_text_by_id(self, pageid):
+        # One full-text extract per response, so one request per page
+        params = {"prop": "extracts", "explaintext": True, "pageids": pageid}
+        data = await self.query(params)
+        page = data.get("query", {}).get("pages", {}).get(str(pageid), {})
+        return page.get("extract") or ""
+
+    async def fetch_page(self, page):
+        """Fetch and cache the text of `page`, returning (page, text)."""
+        text = await self.get_page_text_by_id(page["pageid"])
+        save_page_cache(page["pageid"], page["lastrevid"], page["title"], text)
+        metrics.inc("wiki_pages_total", stage="fetched")
+        return page, text
+
+
+async def _stream_batches(page_batches, concurrency, rate):
+    """Yield (page, text) for every page of the async iterable `page_batches`.
+
+    Pages whose cached revision is current are served from the page cache;
+    the rest are each fetched by a task of their own, dispatched as soon as
+    their listing arrives, so up to `concurrency` requests are in flight and
+    the first pages reach the caller long before the crawl ends.
+    """
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        client = AsyncWikiClient(session, concurrency=concurrency, rate=rate)
+        backlog = collections.deque()
+        pending = set()
+
+        def dispatch():
+            # Cap the pages in flight or finished-but-unconsumed, so a slow
+            # consumer bounds memory instead of letting fetched texts pile up.
+            while backlog and len(pending) < 2 * concurrency:
+                pending.add(asyncio.create_task(client.fetch_page(backlog.popleft())))
+
+        try:
+            async for pages in page_batches(client):
+                stale = []
+                for item in wiki.iter_cached_pages(pages, stale):
+                    yield item
+                backlog.extend(stale)
+                dispatch()
+                done = {task for task in pending if task.done()}
+                pending -= done
+                for task in done:
+                    yield task.result()
+                dispatch()
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    yield task.result()
+                dispatch()
+        finally:
+            for task in pending:
+                task.cancel()
+
+
+def stream_category_texts(category, concurrency=DEFAULT_CONCURRENCY, rate=None):
+    """Yield (page, text) for a category, fetching while the listing is paged."""
+    return _stream_batches(
+        lambda client: client.iter_category_pages(category), concurrency, rate
+    )
+
+
+def stream_pages_text(pages, concurrency=DEFAULT_CONCURRENCY, rate=None):
+    """Yield (page, text) for already-listed pages."""
+
+    async def single_batch(client):
+        yield pages
+
+    return _stream_batches(single_batch, concurrency, rate)
+
+
+_DONE = object()
+
+
+def _iterate(stream, buffer):
+    """Run an async generator on a background thread and iterate it synchronously.
+
+    Items are handed over through a bounded queue, so tokenizing in the caller
+    overlaps with fetching.
+    """
+    items = queue.Queue(maxsize=buffer)
+    stop = threading.Event()
+
+    def offer(item):
+        # Only block while the consumer is still listening.
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    async def produce():
+        async for item in stream:
+            while True:
+                try:
+                    items.put_nowait(item)
+                    break
+                except queue.Full:
+                    if stop.is_set():
+                        return
+                    await asyncio.sleep(0.01)
+
+    def run():
+        try:
+            asyncio.run(produce())
+        except BaseException as e:
+            offer(e)
+        else:
+            offer(_DONE)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item = items.get()
+            if item is _DONE:
+                break
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()
+        thread.join()
+
+
+def iter_category_texts(category, concurrency=DEFAULT_CONCURRENCY, rate=None, buffer=16):
+    """Synchronous view of `stream_category_texts`."""
+    return _iterate(stream_category_texts(category, concurrency, rate), buffer)
+
+
+def iter_pages_text(pages, concurrency=DEFAULT_CONCURRENCY, rate=None, buffer=16):
+    """Synchronous view of `stream_pages_text`."""
+    return _iterate(stream_pages_text(pages, concurrency, rate), buffer)
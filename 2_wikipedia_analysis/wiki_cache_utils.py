@@ -1,24 +1,326 @@
 import json
 import os
-from typing import Any, Dict
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional
 
+import wiki_metrics as metrics
 
-def get_cache_path(category: str) -> str:
-    safe_cat = category.replace("/", "_").replace(" ", "_")
-    cache_dir = os.path.join(os.path.dirname(__file__), "cache")
-    os.makedirs(cache_dir, exist_ok=True)
-    return os.path.join(cache_dir, f"{safe_cat}_freq.json")
+CACHE_DIR = os.environ.get(
+    "WIKI_CACHE_DIR", os.path.join(os.path.dirname(__file__), "cache")
+)
+CACHE_DB = "cache.sqlite3"
+# Bump when the shape of a cached value changes; old entries are then ignored
+# and eventually evicted.
+CACHE_VERSION = 1
+# Total size of all cached values, and of the files of the NumPy result store,
+# before least recently used ones are evicted.
+CACHE_MAX_BYTES = int(os.environ.get("WIKI_CACHE_MAX_BYTES", 1024**3))
+# How long a category's word frequencies are served before being recomputed.
+RESULT_TTL = float(os.environ.get("WIKI_RESULT_TTL", 7 * 24 * 3600))
+# How long past RESULT_TTL the web app still serves a result (flagged as
+# stale) while it is recomputed in the background.
+STALE_TTL = float(os.environ.get("WIKI_STALE_TTL", 7 * 24 * 3600))
+# How long a category's listing of articles and subcategories is reused by
+# recursive crawls before the category is listed again.
+GRAPH_TTL = float(os.environ.get("WIKI_GRAPH_TTL", 24 * 3600))
+# Reads refresh an entry's LRU timestamp at most this often, to keep reads
+# from turning into writes.
+_TOUCH_INTERVAL = 60
 
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    expires_at REAL,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_accessed_at ON entries (accessed_at);
+CREATE TABLE IF NOT EXISTS stats (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    total_size INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO stats VALUES (0, 0);
+CREATE TRIGGER IF NOT EXISTS entries_insert AFTER INSERT ON entries BEGIN
+    UPDATE stats SET total_size = total_size + NEW.size;
+END;
+CREATE TRIGGER IF NOT EXISTS entries_delete AFTER DELETE ON entries BEGIN
+    UPDATE stats SET total_size = total_size - OLD.size;
+END;
+CREATE TRIGGER IF NOT EXISTS entries_update AFTER UPDATE OF size ON entries BEGIN
+    UPDATE stats SET total_size = total_size - OLD.size + NEW.size;
+END;
+CREATE TABLE IF NOT EXISTS files (
+    key TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    pinned INTEGER NOT NULL DEFAULT 0,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS files_path ON files (path);
+CREATE TRIGGER IF NOT EXISTS files_insert AFTER INSERT ON files BEGIN
+    UPDATE stats SET total_size = total_size + NEW.size;
+END;
+CREATE TRIGGER IF NOT EXISTS files_delete AFTER DELETE ON files BEGIN
+    UPDATE stats SET total_size = total_size - OLD.size;
+END;
+CREATE TRIGGER IF NOT EXISTS files_update AFTER UPDATE OF size ON files BEGIN
+    UPDATE stats SET total_size = total_size - OLD.size + NEW.size;
+END;
+"""
 
-def load_result_cache(category: str) -> Dict[str, Any]:
-    path = get_cache_path(category)
-    if os.path.exists(path):
-        with open(path, "r") as f:
-            return json.load(f)
-    return None
+_local = threading.local()
 
 
-def save_result_cache(category: str, result: Dict[str, Any]):
-    path = get_cache_path(category)
-    with open(path, "w") as f:
-        json.dump(result, f, indent=2)
+def get_connection() -> sqlite3.Connection:
+    """Return this thread's connection to the cache database.
+
+    SQLite connections can't be shared across threads or forked processes, so
+    each thread (and each gunicorn worker) opens its own. WAL mode lets readers
+    proceed while one writer commits, and the busy timeout makes concurrent
+    writers wait for each other instead of failing.
+    """
+    path = os.path.join(CACHE_DIR, CACHE_DB)
+    conn = getattr(_local, "conn", None)
+    if conn is None or _local.path != path or _local.pid != os.getpid():
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(_SCHEMA)
+        _local.conn, _local.path, _local.pid = conn, path, os.getpid()
+    return conn
+
+
+def _key(*parts: Any) -> str:
+    return ":".join([f"v{CACHE_VERSION}", *map(str, parts)])
+
+
+def _kind(key: str) -> str:
+    return key.split(":", 2)[1]
+
+
+def load_cache(key: str) -> Optional[Any]:
+    """Return the value stored under `key`, or None if missing or expired."""
+    with metrics.timer("wiki_stage_seconds", stage="cache_read"):
+        value = _load_cache(key)
+    result = "miss" if value is None else "hit"
+    metrics.inc("wiki_cache_requests_total", kind=_kind(key), result=result)
+    return value
+
+
+def _load_cache(key: str) -> Optional[Any]:
+    conn = get_connection()
+    now = time.time()
+    row = conn.execute(
+        "SELECT value, expires_at, accessed_at FROM entries WHERE key = ?", (key,)
+    ).fetchone()
+    if row is None:
+        return None
+    value, expires_at, accessed_at = row
+    if expires_at is not None and expires_at < now:
+        return None
+    if now - accessed_at > _TOUCH_INTERVAL:
+        conn.execute("UPDATE entries SET accessed_at = ? WHERE key = ?", (now, key))
+    return json.loads(value)
+
+
+@metrics.timed("wiki_stage_seconds", stage="cache_write")
+def save_cache(key: str, value: Any, ttl: Optional[float] = None):
+    """Store `value` under `key`; a single upsert, so readers never see half of it."""
+    data = json.dumps(value, separators=(",", ":")).encode()
+    now = time.time()
+    expires_at = now + ttl if ttl is not None else None
+    conn = get_connection()
+    conn.execute(
+        """
+        INSERT INTO entries (key, value, size, expires_at, accessed_at)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT (key) DO UPDATE SET
+            value = excluded.value,
+            size = excluded.size,
+            expires_at = excluded.expires_at,
+            accessed_at = excluded.accessed_at
+        """,
+        (key, data, len(data), expires_at, now),
+    )
+    metrics.inc("wiki_cache_bytes_written_total", len(data), kind=_kind(key))
+    _check_budget(conn)
+
+
+def _check_budget(conn: sqlite3.Connection):
+    (total_size,) = conn.execute("SELECT total_size FROM stats").fetchone()
+    if total_size > CACHE_MAX_BYTES:
+        evict_cache()
+
+
+def track_file(key: str, path: str, size: int, pinned: bool = False):
+    """Count a file of the cache directory against the size budget.
+
+    Unpinned files are evicted (deleted) with the entries, least recently used
+    first; pinned ones are only counted.
+    """
+    conn = get_connection()
+    conn.execute(
+        """
+        INSERT INTO files (key, path, size, pinned, accessed_at)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT (key) DO UPDATE SET
+            path = excluded.path,
+            size = excluded.size,
+            pinned = excluded.pinned,
+            accessed_at = excluded.accessed_at
+        """,
+        (key, path, size, int(pinned), time.time()),
+    )
+    _check_budget(conn)
+
+
+def touch_file(key: str):
+    """Mark a tracked file as used, for LRU eviction."""
+    conn = get_connection()
+    now = time.time()
+    row = conn.execute("SELECT accessed_at FROM files WHERE key = ?", (key,)).fetchone()
+    if row is not None and now - row[0] > _TOUCH_INTERVAL:
+        conn.execute("UPDATE files SET accessed_at = ? WHERE key = ?", (now, key))
+
+
+def forget_files(paths: List[str]):
+    """Stop counting files that were deleted."""
+    get_connection().executemany(
+        "DELETE FROM files WHERE path = ?", [(path,) for path in paths]
+    )
+
+
+def evict_cache(max_bytes: Optional[int] = None):
+    """Drop expired entries, then least recently used entries and files.
+
+    Evicts down to 90% of the budget so that a full cache doesn't evict on
+    every write. Pinned files count towards the budget but stay.
+    """
+    max_bytes = CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    conn = get_connection()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.execute(
+            "DELETE FROM entries WHERE expires_at IS NOT NULL AND expires_at < ?",
+            (time.time(),),
+        )
+        (total_size,) = conn.execute("SELECT total_size FROM stats").fetchone()
+        excess = total_size - int(max_bytes * 0.9)
+        if total_size > max_bytes and excess > 0:
+            victims = conn.execute(
+                """
+                SELECT key, path FROM (
+                    SELECT key, path, size, SUM(size) OVER (
+                        ORDER BY accessed_at, key ROWS UNBOUNDED PRECEDING
+                    ) AS running
+                    FROM (
+                        SELECT key, NULL AS path, size, accessed_at FROM entries
+                        UNION ALL
+                        SELECT key, path, size, accessed_at FROM files
+                        WHERE NOT pinned
+                    )
+                )
+                WHERE running - size < ?
+                """,
+                (excess,),
+            ).fetchall()
+            entries = [(key,) for key, path in victims if path is None]
+            files = [(key, path) for key, path in victims if path is not None]
+            conn.executemany("DELETE FROM entries WHERE key = ?", entries)
+            conn.executemany("DELETE FROM files WHERE key = ?", [f[:1] for f in files])
+            for _, path in files:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def load_result_cache(category: str, max_age: Optional[float] = None):
+    """Return the category's word counts as a memory-mapped `FrequencyTable`.
+
+    Results live in the NumPy store next to this database (see
+    wiki_freq_store), which is only imported once a result is needed. Results
+    older than `max_age` seconds (default: RESULT_TTL) are not returned.
+    """
+    from wiki_freq_store import load_frequencies
+
+    return load_frequencies(_key("result", category), max_age)
+
+
+def load_result_top(category: str, k: int, max_age: Optional[float] = None):
+    """Return the category's k most common (word, count) pairs, or None.
+
+    Reads only the top of the stored result, however many words it holds.
+    """
+    from wiki_freq_store import load_top
+
+    return load_top(_key("result", category), k, max_age)
+
+
+def result_cache_age(category: str) -> Optional[float]:
+    """Seconds since the category's result was stored, or None if it wasn't."""
+    from wiki_freq_store import frequencies_age
+
+    return frequencies_age(_key("result", category))
+
+
+def save_result_cache(category: str, freq: Any):
+    """Store word counts: a Counter, [word, count] pairs or a `FrequencyTable`."""
+    from wiki_freq_store import save_frequencies
+
+    save_frequencies(_key("result", category), freq)
+
+
+def load_page_cache(pageid: int, revid: int) -> Optional[str]:
+    """Return the cached text of a page, or None if it is missing or out of date."""
+    entry = load_cache(_key("page", pageid))
+    if entry is None or entry.get("revid") != revid:
+        return None
+    return entry["text"]
+
+
+def save_page_cache(pageid: int, revid: int, title: str, text: str):
+    entry = {"pageid": pageid, "revid": revid, "title": title, "text": text}
+    save_cache(_key("page", pageid), entry)
+
+
+def load_page_counts(
+    pageid: int, revid: int, tokenizer: str
+) -> Optional[Dict[str, int]]:
+    """Return the word counts of one page revision, if they were stored."""
+    return load_cache(_key("counts", tokenizer, pageid, revid))
+
+
+def save_page_counts(pageid: int, revid: int, counts: Dict[str, int], tokenizer: str):
+    save_cache(_key("counts", tokenizer, pageid, revid), counts)
+
+
+def load_category_state(category: str) -> Optional[Dict[str, Any]]:
+    """Return {"pages": {pageid: revid}, "freq": {word: count}} for a category."""
+    state = load_cache(_key("state", category))
+    if state is None:
+        return None
+    # JSON object keys are strings; page ids are ints everywhere else.
+    state["pages"] = {int(pageid): revid for pageid, revid in state["pages"].items()}
+    return state
+
+
+def save_category_state(category: str, state: Dict[str, Any]):
+    save_cache(_key("state", category), state)
+
+
+def load_category_node(category: str) -> Optional[Dict[str, Any]]:
+    """Return {"pages": [...], "subcategories": [...]} as last listed for a category."""
+    return load_cache(_key("node", category))
+
+
+def save_category_node(category: str, node: Dict[str, Any]):
+    save_cache(_key("node", category), node, ttl=GRAPH_TTL)
@@ -1,18 +1,36 @@
-import sys
+import argparse
+import multiprocessing
+import os
+import re
+import threading
+import time
 from collections import Counter
+from concurrent.futures import (FIRST_COMPLETED, ProcessPoolExecutor,
+                                ThreadPoolExecutor, wait)
+from concurrent.futures.process import BrokenProcessPool
+from itertools import islice
+from urllib.parse import parse_qs, urlsplit
 
-import nltk
-import requests
-from nltk.corpus import stopwords
+import wiki_dump
+import wiki_metrics as metrics
+from wiki_cache_utils import (load_category_node, load_category_state,
+                              load_page_cache, load_page_counts,
+                              load_result_cache, save_category_node,
+                              save_category_state, save_page_cache,
+                              save_page_counts, save_result_cache)
+from wiki_topk import TopWords, capacity_for_error
 
-from wiki_cache_utils import load_result_cache, save_result_cache
 
+def download_nltk_resources(punkt=True):
+    """Download the missing NLTK data: stopwords, and the punkt models if `punkt`."""
+    import nltk
 
-def download_nltk_resources():
     try:
         nltk.data.find("corpora/stopwords")
     except LookupError:
         nltk.download("stopwords")
+    if not punkt:
+        return
     try:
         nltk.data.find("tokenizers/punkt")
     except LookupError:
@@ -27,98 +45,845 @@ def download_nltk_resources():
             print("Could not download 'punkt_tab'. Proceeding anyway.")
 
 
-def get_category_members(category, cmcontinue=None):
-    """Fetch all page titles in a Wikipedia category, handling continuation."""
-    S = requests.Session()
-    URL = "https://en.wikipedia.org/w/api.php"
+# NLTK is imported, and its data checked and loaded, once per process and only
+# when words are first counted, so importing this module (and the web app)
+# stays fast.
+_stop_words = None
+_punkt_loaded = False
+_warm_up_lock = threading.Lock()
+
+
+def warm_up(tokenizer=None):
+    """Load the NLTK data needed to count words with `tokenizer`, once.
+
+    Reads the stopwords into a frozenset and, for the nltk tokenizer, loads the
+    punkt model, downloading whichever is missing; the regex tokenizer needs no
+    punkt. Later calls return at once.
+    """
+    global _stop_words, _punkt_loaded
+    tokenizer = tokenizer or DEFAULT_TOKENIZER
+    if _stop_words is not None and (_punkt_loaded or tokenizer != "nltk"):
+        return
+    with _warm_up_lock:
+        if _stop_words is None:
+            download_nltk_resources(punkt=False)
+            from nltk.corpus import stopwords
+
+            _stop_words = frozenset(stopwords.words("english"))
+        if tokenizer == "nltk" and not _punkt_loaded:
+            import nltk
+
+            download_nltk_resources()
+            nltk.word_tokenize("Warm up.")
+            _punkt_loaded = True
+
+
+def get_stop_words():
+    """Return the English stopwords as a frozenset."""
+    if _stop_words is None:
+        warm_up("regex")
+    return _stop_words
+
+
+API_URL = os.environ.get("WIKI_API_URL", "https://en.wikipedia.org/w/api.php")
+# An index built from a Wikipedia dump by wiki_dump.py. When set, category
+# listings and page texts are read from it instead of the API.
+DUMP_INDEX = os.environ.get("WIKI_DUMP_INDEX")
+# MediaWiki caps `titles` and `pageids` at 50 per query for regular clients.
+# Revisions are looked up that many pages at a time, but TextExtracts returns
+# one full-text extract per response (`exlimit` only batches intros), so page
+# texts are fetched one page per request.
+MAX_TITLES_PER_QUERY = 50
+# Categories listed at once by a recursive crawl.
+CRAWL_WORKERS = 8
+# When set, categories are counted approximately, tracking about this many
+# words at a time (see wiki_topk), instead of every word exactly.
+MAX_WORDS = int(os.environ.get("WIKI_MAX_WORDS", 0)) or None
+
+_session = None
+
+
+def get_session():
+    """Return a process-wide pooled session so connections are reused."""
+    global _session
+    if _session is None:
+        import requests
+
+        _session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=16)
+        _session.mount("https://", adapter)
+        _session.mount("http://", adapter)
+        _session.hooks["response"].append(_record_response)
+    return _session
+
+
+def _api_endpoint(params):
+    """Label for a MediaWiki API query: categorymembers, info or extracts."""
+    if "categorymembers" in (params.get("list"), params.get("generator")):
+        return "categorymembers"
+    return params.get("prop", "other")
+
+
+def _record_response(response, **kwargs):
+    if not metrics.enabled():
+        return
+    query = parse_qs(urlsplit(response.request.url).query)
+    endpoint = _api_endpoint({k: v[-1] for k, v in query.items()})
+    status = response.status_code
+    seconds = response.elapsed.total_seconds()
+    metrics.inc("wiki_api_requests_total", endpoint=endpoint, status=status)
+    metrics.inc("wiki_api_bytes_total", len(response.content), endpoint=endpoint)
+    metrics.observe("wiki_api_request_seconds", seconds, endpoint=endpoint)
+    if status >= 400:
+        metrics.inc("wiki_api_errors_total", endpoint=endpoint, reason="http")
+
+
+@metrics.timed("wiki_stage_seconds", stage="list")
+def get_category_pages(category):
+    """List the article pages of a category together with their current revision ids.
+
+    A `categorymembers` generator combined with `prop=info` returns page ids and
+    `lastrevid` for up to 500 members per request, so checking a whole category
+    for edits costs about as much as listing it.
+    """
+    if DUMP_INDEX:
+        return wiki_dump.category_pages(DUMP_INDEX, category)
+    S = get_session()
+    PARAMS = {
+        "action": "query",
+        "generator": "categorymembers",
+        "gcmtitle": f"Category:{category}",
+        "gcmnamespace": 0,
+        "gcmlimit": "max",
+        "prop": "info",
+        "format": "json",
+    }
+    pages = []
+    cont = {}
+    while True:
+        response = S.get(url=API_URL, params={**PARAMS, **cont})
+        data = response.json()
+        pages.extend(_page_revisions(data))
+        cont = data.get("continue")
+        if not cont:
+            break
+    return pages
+
+
+def _page_revisions(data):
+    return [
+        {"pageid": p["pageid"], "title": p["title"], "lastrevid": p["lastrevid"]}
+        for p in data.get("query", {}).get("pages", {}).values()
+        if "missing" not in p
+    ]
+
+
+def category_key(category, depth=0, max_pages=None, max_words=None):
+    """Name under which the counts of a (possibly recursive) crawl are cached."""
+    key = category
+    if depth or max_pages is not None:
+        key += f"|depth={depth}|max_pages={max_pages}"
+    if max_words:
+        key += f"|max_words={max_words}"
+    return key
+
+
+def _category_name(title):
+    return title.removeprefix("Category:").replace(" ", "_")
+
+
+def list_category(category):
+    """List the articles (with revision ids) and subcategories of a category."""
+    if DUMP_INDEX:
+        return wiki_dump.category_node(DUMP_INDEX, category)
+    S = get_session()
     PARAMS = {
         "action": "query",
-        "list": "categorymembers",
-        "cmtitle": f"Category:{category}",
-        "cmlimit": "500",
+        "generator": "categorymembers",
+        "gcmtitle": f"Category:{category}",
+        "gcmnamespace": "0|14",
+        "gcmlimit": "max",
+        "prop": "info",
         "format": "json",
     }
-    if cmcontinue:
-        PARAMS["cmcontinue"] = cmcontinue
-    response = S.get(url=URL, params=PARAMS)
-    data = response.json()
-    members = data["query"]["categorymembers"]
-    titles = [
-        m["title"] for m in members if m["ns"] == 0
-    ]  # ns=0 means main/article namespace
-    next_continue = data.get("continue", {}).get("cmcontinue")
-    return titles, next_continue
-
-
-def get_all_category_members(category):
-    titles = []
-    cmcontinue = None
+    node = {"pages": [], "subcategories": []}
+    cont = {}
     while True:
-        batch, cmcontinue = get_category_members(category, cmcontinue)
-        titles.extend(batch)
-        if not cmcontinue:
+        response = S.get(url=API_URL, params={**PARAMS, **cont})
+        data = response.json()
+        members = data.get("query", {}).get("pages", {})
+        for page in members.values():
+            if page["ns"] == 14:
+                node["subcategories"].append(_category_name(page["title"]))
+        articles = {k: p for k, p in members.items() if p["ns"] == 0}
+        node["pages"].extend(_page_revisions({"query": {"pages": articles}}))
+        cont = data.get("continue")
+        if not cont:
             break
-    return titles
+    return node
+
+
+def get_category_node(category):
+    """Return (listing, fresh) for a category, reusing a cached listing if any.
+
+    Revision ids in a cached listing may be out of date; `fresh` tells whether
+    the listing was just made.
+    """
+    node = load_category_node(category)
+    if node is not None:
+        return node, False
+    node = list_category(category)
+    save_category_node(category, node)
+    return node, True
+
+
+def get_page_revisions(pageids):
+    """Return the current revisions of up to MAX_TITLES_PER_QUERY pages."""
+    if DUMP_INDEX:
+        return wiki_dump.page_revisions(DUMP_INDEX, pageids)
+    S = get_session()
+    PARAMS = {
+        "action": "query",
+        "prop": "info",
+        "pageids": "|".join(str(pageid) for pageid in pageids),
+        "format": "json",
+    }
+    response = S.get(url=API_URL, params=PARAMS)
+    return _page_revisions(response.json())
+
+
+@metrics.timed("wiki_stage_seconds", stage="list")
+def crawl_category_tree(category, max_depth=1, max_pages=None, workers=CRAWL_WORKERS):
+    """List the articles in a category and its subcategories, breadth first.
 
+    Subcategories are followed `max_depth` levels down, each level's
+    categories being listed concurrently. A category reachable through
+    several paths (or a cycle) is visited once, an article in several
+    categories is kept once, and the crawl stops after `max_pages` articles.
+    Listings are cached, so crawls of overlapping trees only look up the
+    current revision ids of the pages they already know about.
+    """
+    root = _category_name(category)
+    seen = {root}
+    frontier = [root]
+    pages = {}
+    known = []  # pages from cached listings, whose revisions need refreshing
+    full = False
+    with ThreadPoolExecutor(workers) as executor:
+        for depth in range(max_depth + 1):
+            subcategories = []
+            for node, fresh in executor.map(get_category_node, frontier):
+                for page in node["pages"]:
+                    if page["pageid"] not in pages:
+                        pages[page["pageid"]] = dict(page)
+                        if not fresh:
+                            known.append(page["pageid"])
+                        full = max_pages is not None and len(pages) >= max_pages
+                        if full:
+                            break
+                if full:
+                    # No subcategory is queued once the cap is reached
+                    break
+                for subcategory in node["subcategories"]:
+                    if subcategory not in seen:
+                        seen.add(subcategory)
+                        subcategories.append(subcategory)
+            print(
+                f"Depth {depth}: listed {len(frontier)} categories, "
+                f"{len(pages)} pages so far"
+            )
+            if full or not subcategories:
+                break
+            frontier = subcategories
 
-def get_page_text(title):
-    S = requests.Session()
-    URL = "https://en.wikipedia.org/w/api.php"
+        batches = [
+            known[start : start + MAX_TITLES_PER_QUERY]
+            for start in range(0, len(known), MAX_TITLES_PER_QUERY)
+        ]
+        current = {}
+        for revisions in executor.map(get_page_revisions, batches):
+            current.update((page["pageid"], page["lastrevid"]) for page in revisions)
+    for pageid in known:
+        if pageid in current:
+            pages[pageid]["lastrevid"] = current[pageid]
+        else:
+            del pages[pageid]  # deleted since it was listed
+    return list(pages.values())
+
+
+def get_page_text_by_id(pageid):
+    """Fetch the plain-text extract of one page ("" if it has none)."""
+    S = get_session()
     PARAMS = {
         "action": "query",
         "prop": "extracts",
         "explaintext": True,
-        "titles": title,
+        "pageids": pageid,
         "format": "json",
     }
-    response = S.get(url=URL, params=PARAMS)
-    data = response.json()
-    pages = data["query"]["pages"]
-    for page_id in pages:
-        return pages[page_id].get("extract", "")
-    return ""
+    response = S.get(url=API_URL, params=PARAMS)
+    page = response.json().get("query", {}).get("pages", {}).get(str(pageid), {})
+    return page.get("extract") or ""
 
 
-def main():
-    if len(sys.argv) != 2:
-        print("Usage: python wiki_category_word_freq.py <Wikipedia_Category>")
-        sys.exit(1)
-    category = sys.argv[1]
-    # Try to load cached result
-    cached = load_result_cache(category)
-    if cached:
-        print(f"Loaded cached results for category: {category}\n")
-        for word, count in cached["freq"][:50]:
-            print(f"{word}: {count}")
+def get_pages_text_by_id(pageids):
+    """Fetch the texts of pages by id: one request each, or one dump query."""
+    if DUMP_INDEX:
+        return wiki_dump.pages_text(DUMP_INDEX, pageids)
+    return {pageid: get_page_text_by_id(pageid) for pageid in pageids}
+
+
+def iter_cached_pages(pages, stale):
+    """Yield (page, text) for pages whose cached revision is still current.
+
+    Pages that are new or were edited since they were cached are appended to
+    `stale` so the caller can fetch just those.
+    """
+    for page in pages:
+        text = load_page_cache(page["pageid"], page["lastrevid"])
+        if text is None:
+            stale.append(page)
+        else:
+            yield page, text
+
+
+def iter_pages_text(pages):
+    """Yield (page, text) for the given pages, downloading only stale ones."""
+    if DUMP_INDEX:
+        # The dump index is already local; there is nothing to cache.
+        for start in range(0, len(pages), MAX_TITLES_PER_QUERY):
+            batch = pages[start : start + MAX_TITLES_PER_QUERY]
+            texts = get_pages_text_by_id([page["pageid"] for page in batch])
+            for page in batch:
+                yield page, texts.pop(page["pageid"])
         return
-    download_nltk_resources()
-    stop_words = set(stopwords.words("english"))
-    all_text = []
-    print(f"Fetching pages in category: {category}")
-    titles = get_all_category_members(category)
-    print(f"Found {len(titles)} pages. Downloading text...")
-    for idx, title in enumerate(titles, 1):
-        print(f"[{idx}/{len(titles)}] {title}")
-        text = get_page_text(title)
-        all_text.append(text)
-    print("Tokenizing and counting word frequencies...")
-    words = []
-    for idx, text in enumerate(all_text):
+    stale = []
+    yield from iter_cached_pages(pages, stale)
+    if stale:
+        print(f"Downloading {len(stale)} new or edited pages...")
+    for fetched, page in enumerate(stale, 1):
+        print(f"[{fetched}/{len(stale)}] {page['title']}")
+        text = get_page_text_by_id(page["pageid"])
+        metrics.inc("wiki_pages_total", stage="fetched")
+        save_page_cache(page["pageid"], page["lastrevid"], page["title"], text)
+        yield page, text
+
+
+# "nltk" runs punkt + the Treebank tokenizer; "regex" is a much faster splitter
+# that keeps the same alphabetic tokens, but for the odd single letter before a
+# capitalized word (see fast_word_tokenize).
+TOKENIZERS = ("nltk", "regex")
+DEFAULT_TOKENIZER = os.environ.get("WIKI_TOKENIZER", "nltk")
+
+# Punctuation the Treebank tokenizer always splits off, so it can never be part
+# of an alphabetic token.
+_SPLIT_CHARS = str.maketrans(
+    dict.fromkeys(";@#$%&?!*()[]{}<>\"`\u00ab\u00bb\u201c\u201d\u2018\u2019\u201e\u2012\u2013\u2014\u2015", " ")
+)
+# Ellipses, double dashes, '' quotes, and commas/colons not followed by a
+# digit. A comma right after a period is left alone: punkt never ends a
+# sentence there, so the period stays on the word and NLTK drops it as
+# non-alphabetic.
+_SPLIT_RUNS = re.compile(r"\.{2,}|--|''|(?<!\.)[,:](?!\d)")
+# Treebank's quote rules: a leading quote is split off unless it starts a
+# clitic, and a trailing clitic or quote is split off the word before it.
+_LEADING_CLITIC = re.compile(r"'(?:re|ve|ll|m|t|s|d|n)\b", re.IGNORECASE)
+_TRAILING_CLITIC = re.compile(r"(?<=[^' ])(?:'[sSmMdD]|'ll|'LL|'re|'RE|'ve|'VE|n't|N'T|')$")
+_COMPOUNDS = {
+    "cannot": ("can", "not"),
+    "gimme": ("gim", "me"),
+    "gonna": ("gon", "na"),
+    "gotta": ("got", "ta"),
+    "lemme": ("lem", "me"),
+    "wanna": ("wan", "na"),
+}
+# The alphabetic abbreviations of punkt's English model. Punkt does not end a
+# sentence at them, so their period stays attached and NLTK drops the token as
+# non-alphabetic.
+_ABBREVIATIONS = frozenset(
+    "adm ala ariz aug ave bros c calif chg cie co col colo conn corp cos ct d dec "
+    "dr e f feb fla fri ft g ga gen h ill inc jan jr k kan ky l lt ltd m maj "
+    "messrs mg mich minn mr mrs ms n nev nov oct ok okla ore p pa prof r rep reps "
+    "s sen sep sept sr st sw t tenn tues v va vs vt w wash wed wis yr".split()
+)
+
+
+def _ends_sentence(word, following, common_words):
+    """Whether punkt ends a sentence at the period after `word`.
+
+    `following` is the next token, or None at the end of the text. After an
+    abbreviation or an initial, punkt only starts a sentence at a capitalized
+    word it has seen in lowercase; `common_words` stand in for those.
+    """
+    if following is None:
+        return True
+    starts_sentence = following[0].isupper() and following.lower() in common_words
+    if word.lower() in _ABBREVIATIONS:
+        return starts_sentence
+    if len(word) == 1 and following[0].isalpha():
+        return starts_sentence
+    return True
+
+
+def fast_word_tokenize(text):
+    """Yield the alphabetic tokens `nltk.word_tokenize` would produce for `text`.
+
+    Non-alphabetic tokens are dropped by every caller, so instead of running
+    punkt and the Treebank regexes this only separates punctuation that would
+    have been split off anyway, then strips sentence-final periods and
+    clitics ('s, n't, ...) the way the Treebank tokenizer does.
+
+    Periods after words are split off where punkt would end a sentence (see
+    _ends_sentence), so only abbreviations and initials keep theirs.
+    """
+    common_words = get_stop_words()
+    text = _SPLIT_RUNS.sub(" ", text).translate(_SPLIT_CHARS)
+    tokens = text.split()
+    for i, token in enumerate(tokens):
+        if token.endswith(".") and token[:-1].isalpha():
+            following = tokens[i + 1] if i + 1 < len(tokens) else None
+            if _ends_sentence(token[:-1], following, common_words):
+                token = token[:-1]
+        if "'" in token:
+            if token[0] == "'" and not _LEADING_CLITIC.match(token):
+                token = token[1:]
+            match = _TRAILING_CLITIC.search(token)
+            if match:
+                token = token[: match.start()]
+        if token.isalpha():
+            parts = _COMPOUNDS.get(token.lower())
+            if parts:
+                yield token[: len(parts[0])]
+                yield token[len(parts[0]) :]
+            else:
+                yield token
+
+
+def iter_page_words(text, stop_words, tokenizer=None):
+    """Yield the lowercase, alphabetic, non-stopword tokens of one page."""
+    if (tokenizer or DEFAULT_TOKENIZER) == "regex":
+        tokens = fast_word_tokenize(text)
+    else:
+        import nltk
+
+        tokens = nltk.word_tokenize(text)
+    for token in tokens:
+        if token.isalpha():
+            word = token.lower()
+            if word not in stop_words:
+                yield word
+
+
+def count_page_words(text, stop_words, tokenizer=None):
+    return Counter(iter_page_words(text, stop_words, tokenizer))
+
+
+# Below this many pages, starting worker processes costs more than it saves.
+PARALLEL_MIN_PAGES = 64
+PARALLEL_CHUNK_SIZE = 16
+
+# Tokenizer pools by (workers, tokenizer), started on first use and shared by
+# every crawl in the process, so concurrent jobs don't each start a pool.
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def _init_tokenizer_worker(tokenizer):
+    warm_up(tokenizer)
+
+
+def _tokenizer_pool(workers, tokenizer):
+    with _pools_lock:
+        pool = _pools.get((workers, tokenizer))
+        if pool is None:
+            # Workers are never forked from this process: the web app has
+            # threads running (Flask, jobs, the fetcher) that a fork would copy
+            # mid-flight, locks included
+            methods = multiprocessing.get_all_start_methods()
+            context = "forkserver" if "forkserver" in methods else "spawn"
+            pool = _pools[(workers, tokenizer)] = ProcessPoolExecutor(
+                workers,
+                mp_context=multiprocessing.get_context(context),
+                initializer=_init_tokenizer_worker,
+                initargs=(tokenizer,),
+            )
+        return pool
+
+
+def _discard_pool(workers, tokenizer, pool):
+    with _pools_lock:
+        if _pools.get((workers, tokenizer)) is pool:
+            del _pools[(workers, tokenizer)]
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _count_chunk(texts, tokenizer):
+    """Worker side: word counts for each text, or an error message if it failed.
+
+    Also returns the time spent, as workers can't record metrics themselves.
+    """
+    start = time.perf_counter()
+    results = []
+    for text in texts:
         try:
-            tokens = nltk.word_tokenize(text)
-            tokens = [
-                w.lower() for w in tokens if w.isalpha() and w.lower() not in stop_words
-            ]
-            words.extend(tokens)
+            results.append(count_page_words(text, get_stop_words(), tokenizer))
         except Exception as e:
-            print(f"Tokenization failed for page {idx+1}: {e}")
-    freq = Counter(words)
-    # Save result to cache
-    save_result_cache(category, {"freq": freq.most_common()})
-    print("\nCumulative frequency of non-common words:")
+            results.append(str(e))
+    return results, time.perf_counter() - start
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def iter_page_counts(items, total, workers=None, tokenizer=None):
+    """Yield (page, counts) for each (page, text), tokenizing on `workers` processes.
+
+    Each worker warms up once and returns per-page Counters for a
+    chunk of pages, which the caller merges. The pool of workers is shared by
+    all calls with the same `workers` and `tokenizer`. Small inputs (`total`
+    pages) or `workers=1` are tokenized in this process. `counts` is None for
+    pages that failed to tokenize.
+    """
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or total < PARALLEL_MIN_PAGES:
+        stop_words = get_stop_words()
+        for page, text in items:
+            start = time.perf_counter()
+            try:
+                counts = count_page_words(text, stop_words, tokenizer)
+            except Exception as e:
+                print(f"Tokenization failed for page {page['title']}: {e}")
+                counts = None
+            metrics.inc("wiki_tokenize_seconds_total", time.perf_counter() - start)
+            yield page, counts
+        return
+
+    def results(future):
+        chunk_counts, seconds = future.result()
+        metrics.inc("wiki_tokenize_seconds_total", seconds)
+        for page, counts in zip(pending.pop(future), chunk_counts):
+            if isinstance(counts, str):
+                print(f"Tokenization failed for page {page['title']}: {counts}")
+                counts = None
+            yield page, counts
+
+    pool = _tokenizer_pool(workers, tokenizer)
+    pending = {}
+    try:
+        for chunk in _chunks(items, PARALLEL_CHUNK_SIZE):
+            texts = [text for _, text in chunk]
+            future = pool.submit(_count_chunk, texts, tokenizer)
+            pending[future] = [page for page, _ in chunk]
+            # Keep every worker busy without reading the whole stream ahead.
+            if len(pending) >= 2 * workers:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield from results(future)
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield from results(future)
+    except BrokenProcessPool:
+        # A worker died: the next call starts a new pool
+        _discard_pool(workers, tokenizer, pool)
+        raise
+    finally:
+        # The pool outlives this call: don't leave it chunks nobody will read
+        for future in pending:
+            future.cancel()
+
+
+def _report_fetched(items, progress):
+    for fetched, item in enumerate(items, 1):
+        progress(pages_fetched=fetched)
+        yield item
+
+
+@metrics.timed("wiki_stage_seconds", stage="update")
+def update_category_frequencies(
+    category,
+    fetch_texts=iter_pages_text,
+    workers=None,
+    tokenizer=None,
+    progress=None,
+    depth=0,
+    max_pages=None,
+    max_words=MAX_WORDS,
+):
+    """Bring a category's word counts up to date with its current members.
+
+    Per-page counts are stored per revision, and the category total is kept
+    alongside the page revisions it was built from. Pages that left the
+    category or were edited have their old counts subtracted, and only new or
+    edited pages are fetched and tokenized, so the cost of an update follows
+    the number of changed pages. `fetch_texts(pages)` yields (page, text);
+    `workers` and `tokenizer` are passed to `iter_page_counts`; counts made
+    with different tokenizers are kept apart. `progress(**counts)`, if given,
+    is called as pages are discovered, fetched and tokenized. With `depth` or
+    `max_pages`, pages come from `crawl_category_tree` instead and the counts
+    are kept under `category_key(category, depth, max_pages)`.
+
+    With `max_words`, the counts are a `TopWords` summary tracking about that
+    many words, so memory stays bounded however many words the crawl finds.
+    Such counts can't have pages subtracted, so every page is counted again
+    (from the per-page counts where stored) and no category total is kept.
+    """
+    tokenizer = tokenizer or DEFAULT_TOKENIZER
+    name = category_key(category, depth, max_pages)
+    if name == category:
+        pages = get_category_pages(category)
+    else:
+        pages = crawl_category_tree(category, depth, max_pages)
+    metrics.inc("wiki_pages_total", len(pages), stage="listed")
+    current = {page["pageid"]: page["lastrevid"] for page in pages}
+    state = None if max_words else load_category_state(name)
+    if state and state.get("tokenizer", "nltk") != tokenizer:
+        state = None
+    if max_words:
+        freq = TopWords(max_words)
+    else:
+        freq = Counter(state["freq"]) if state else Counter()
+    counted = state["pages"] if state else {}
+
+    for pageid, revid in list(counted.items()):
+        if current.get(pageid) == revid:
+            continue
+        counts = load_page_counts(pageid, revid, tokenizer)
+        if counts is None:
+            # The old counts are gone, so the total can't be adjusted; rebuild.
+            freq, counted = Counter(), {}
+            break
+        freq.subtract(counts)
+        del counted[pageid]
+
+    changed = [page for page in pages if counted.get(page["pageid"]) != page["lastrevid"]]
+    print(
+        f"Found {len(pages)} pages in category: {category}, "
+        f"{len(pages) - len(changed)} unchanged since the last count."
+    )
+    uncounted = []
+    for page in changed:
+        counts = load_page_counts(page["pageid"], page["lastrevid"], tokenizer)
+        if counts is None:
+            uncounted.append(page)
+        else:
+            freq.update(counts)
+            counted[page["pageid"]] = page["lastrevid"]
+    if progress:
+        progress(pages_discovered=len(pages), pages_to_fetch=len(uncounted))
+    if uncounted:
+        warm_up(tokenizer)
+        print(f"Tokenizing {len(uncounted)} pages with the {tokenizer} tokenizer...")
+    # Pages flow through fetch -> tokenize -> count as they arrive, so only the
+    # pages being counted (plus the fetcher's small buffer) are held in memory.
+    texts = fetch_texts(uncounted)
+    if progress:
+        texts = _report_fetched(texts, progress)
+    results = iter_page_counts(texts, len(uncounted), workers, tokenizer)
+    for tokenized, (page, counts) in enumerate(results, 1):
+        if progress:
+            progress(pages_tokenized=tokenized)
+        if counts is None:
+            metrics.inc("wiki_pages_total", stage="failed")
+            continue
+        metrics.inc("wiki_pages_total", stage="tokenized")
+        if metrics.enabled():
+            metrics.inc("wiki_words_total", sum(counts.values()))
+        save_page_counts(page["pageid"], page["lastrevid"], counts, tokenizer)
+        freq.update(counts)
+        counted[page["pageid"]] = page["lastrevid"]
+
+    if max_words:
+        print(
+            f"Approximate counts of {freq.total} words: each is low by at most "
+            f"{freq.error} (bound {freq.bound()})."
+        )
+        return freq
+    freq = +freq  # drop words whose count fell to zero
+    state = {"tokenizer": tokenizer, "pages": counted, "freq": freq}
+    save_category_state(name, state)
+    return freq
+
+
+def main():
+    global DUMP_INDEX
+    parser = argparse.ArgumentParser(
+        description="Count non-common words across the pages of a Wikipedia category."
+    )
+    parser.add_argument("category", help="Wikipedia category, e.g. Large_language_models")
+    parser.add_argument(
+        "--async",
+        dest="use_async",
+        action="store_true",
+        help="fetch pages concurrently and tokenize them as they arrive",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=8,
+        help="maximum in-flight API requests with --async (default: 8)",
+    )
+    parser.add_argument(
+        "--rate",
+        type=float,
+        default=None,
+        help="maximum API requests per second with --async (default: unlimited)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="processes used for tokenizing (default: one per CPU core)",
+    )
+    parser.add_argument(
+        "--tokenizer",
+        choices=TOKENIZERS,
+        default=DEFAULT_TOKENIZER,
+        help="nltk (punkt + Treebank) or regex, a faster splitter keeping "
+        f"almost exactly the same words (default: {DEFAULT_TOKENIZER})",
+    )
+    parser.add_argument(
+        "--refresh",
+        action="store_true",
+        help="update the cached result; only new or edited pages are re-downloaded",
+    )
+    parser.add_argument(
+        "--depth",
+        type=int,
+        default=0,
+        help="also count pages in subcategories this many levels down (default: 0)",
+    )
+    parser.add_argument(
+        "--max-pages",
+        type=int,
+        default=None,
+        help="stop a recursive crawl after this many pages (default: no limit)",
+    )
+    parser.add_argument(
+        "--dump-index",
+        default=DUMP_INDEX,
+        help="read categories and texts from this index built by wiki_dump.py "
+        "instead of the API (default: $WIKI_DUMP_INDEX)",
+    )
+    approximate = parser.add_mutually_exclusive_group()
+    approximate.add_argument(
+        "--max-words",
+        type=int,
+        default=MAX_WORDS,
+        help="count approximately, tracking about this many words, to bound "
+        "memory on huge crawls (default: $WIKI_MAX_WORDS, or exact counts)",
+    )
+    approximate.add_argument(
+        "--max-error",
+        type=float,
+        help="count approximately, with counts low by at most this fraction of "
+        "all words counted (e.g. 0.0001)",
+    )
+    parser.add_argument(
+        "--compare",
+        nargs="+",
+        metavar="CATEGORY",
+        help="print the words that set the category apart from these ones",
+    )
+    parser.add_argument(
+        "--method",
+        choices=("log-odds", "tf-idf"),
+        default="log-odds",
+        help="how --compare scores words (default: log-odds)",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="print request, throughput and cache statistics at the end",
+    )
+    args = parser.parse_args()
+    DUMP_INDEX = args.dump_index
+    if args.max_error:
+        args.max_words = capacity_for_error(args.max_error)
+    if args.profile:
+        metrics.enable()
+    start = time.perf_counter()
+    try:
+        run(args)
+    finally:
+        if args.profile:
+            print("\nProfile:")
+            print(metrics.summary(time.perf_counter() - start))
+
+
+def run(args):
+    if args.compare:
+        run_compare(args)
+        return
+    freq, cached = category_frequencies(args.category, args)
+    if cached:
+        print(f"Loaded cached results for category: {args.category}\n")
+    else:
+        print("\nCumulative frequency of non-common words:")
     for word, count in freq.most_common(50):
         print(f"{word}: {count}")
 
 
+def category_frequencies(category, args):
+    """Return (counts, whether they were cached) for a category of the CLI."""
+    name = category_key(category, args.depth, args.max_pages, args.max_words)
+    # Try to load cached result
+    cached = None if args.refresh else load_result_cache(name)
+    if cached:
+        return cached, True
+    fetch_texts = iter_pages_text
+    if args.use_async and not DUMP_INDEX:
+        from wiki_async_fetch import iter_pages_text as iter_async
+
+        print(f"Fetching with concurrency={args.concurrency}")
+
+        def fetch_async(pages):
+            return iter_async(pages, concurrency=args.concurrency, rate=args.rate)
+
+        fetch_texts = fetch_async
+
+    freq = update_category_frequencies(
+        category,
+        fetch_texts,
+        workers=args.workers,
+        tokenizer=args.tokenizer,
+        depth=args.depth,
+        max_pages=args.max_pages,
+        max_words=args.max_words,
+    )
+    # Save result to cache
+    save_result_cache(name, freq)
+    return freq, False
+
+
+def run_compare(args):
+    from wiki_compare import distinctive_words
+
+    categories = list(dict.fromkeys([args.category, *args.compare]))
+    names = [
+        category_key(category, args.depth, args.max_pages, args.max_words)
+        for category in categories
+    ]
+    for _ in range(2):
+        for category in categories:
+            category_frequencies(category, args)
+        # Compared as stored: tables of ids in one shared vocabulary, loaded
+        # once every category is saved. A save can reset the store, dropping
+        # the tables saved before it; those are then computed again.
+        tables = [load_result_cache(name) for name in names]
+        if None not in tables:
+            break
+    else:
+        print("The word store was reset while comparing; run the comparison again.")
+        return
+    for category, top in zip(categories, distinctive_words(tables, 30, args.method)):
+        print(f"\nMost distinctive words of {category} ({args.method}):")
+        for word, score, count in top:
+            print(f"{word}: {score:.2f} ({count})")
+
+
 if __name__ == "__main__":
     main()
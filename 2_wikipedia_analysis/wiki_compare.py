@@ -0,0 +1,85 @@
+"""Find the words that set categories apart from each other.
+
+Categories are compared through their stored frequency tables (see
+wiki_freq_store) as one sparse category x word matrix in coordinate form:
+an entry for each word a category contains, so the work grows with the
+number of entries rather than categories x vocabulary. Per-word totals come
+from `bincount` over vocabulary ids, which are already small dense integers.
+"""
+
+import numpy as np
+
+METHODS = ("log-odds", "tf-idf")
+DEFAULT_METHOD = "log-odds"
+
+
+def _entries(tables):
+    """The matrix entries: (category index, vocabulary id, count) arrays."""
+    rows = np.repeat(np.arange(len(tables)), [len(table) for table in tables])
+    ids = np.concatenate([table.ids for table in tables]).astype(np.intp)
+    counts = np.concatenate([table.counts for table in tables]).astype(np.float64)
+    return rows, ids, counts
+
+
+def log_odds(rows, ids, counts, categories, prior=None):
+    """z-scores of each word's log-odds in its category against all others.
+
+    Uses the informative Dirichlet prior of Monroe et al. (2008), "Fightin'
+    Words": `prior` pseudo-counts (default: one per word in the vocabulary
+    compared) shared out in proportion to each word's overall frequency, so
+    rare words need more evidence to rank high than common ones.
+    """
+    word_totals = np.bincount(ids, weights=counts)
+    category_totals = np.bincount(rows, weights=counts, minlength=categories)
+    total = category_totals.sum()
+    if prior is None:
+        prior = np.count_nonzero(word_totals)
+    alpha = prior * word_totals[ids] / total
+    inside, outside = counts, word_totals[ids] - counts
+    inside_total = category_totals[rows]
+    outside_total = total - inside_total
+    delta = np.log(inside + alpha) - np.log(inside_total + prior - inside - alpha)
+    delta -= np.log(outside + alpha) - np.log(outside_total + prior - outside - alpha)
+    variance = 1 / (inside + alpha) + 1 / (outside + alpha)
+    return delta / np.sqrt(variance)
+
+
+def tf_idf(rows, ids, counts, categories):
+    """Term frequency in the category times log(categories / categories with it).
+
+    `categories` counts every category compared, empty ones included.
+    """
+    document_frequency = np.bincount(ids)
+    category_totals = np.bincount(rows, weights=counts, minlength=categories)
+    return counts / category_totals[rows] * np.log(categories / document_frequency[ids])
+
+
+SCORES = {"log-odds": log_odds, "tf-idf": tf_idf}
+
+
+def distinctive_words(tables, n=30, method=DEFAULT_METHOD):
+    """Return each table's `n` most distinctive (word, score, count), best first.
+
+    `tables` are `FrequencyTable`s of the categories compared, which must
+    share a vocabulary; each is scored against all the others together.
+    Raises `VocabularyReset` if any was read before the vocabulary was reset.
+    """
+    for table in tables:
+        if len(table):
+            table.vocabulary.check(table.generation)
+    rows, ids, counts = _entries(tables)
+    scores = SCORES[method](rows, ids, counts, len(tables))
+    results, start = [], 0
+    for table in tables:
+        end = start + len(table)
+        segment = scores[start:end]
+        top = np.arange(len(segment))
+        if n < len(segment):
+            top = np.argpartition(-segment, n)[:n]
+        # Ties keep the table's order: the more frequent word first
+        top = top[np.lexsort((top, -segment[top]))] + start
+        words = table.lookup(ids[top])
+        top_counts = counts[top].astype(int).tolist()
+        results.append(list(zip(words, scores[top].tolist(), top_counts)))
+        start = end
+    return results
@@ -0,0 +1,361 @@
+"""Build and query a local index of a Wikipedia XML dump.
+
+`ingest()` streams a pages-articles dump (`*.xml.bz2`) into an SQLite index
+of article texts and category membership, so categories can be counted
+without the API (see WIKI_DUMP_INDEX in wiki_category_word_freq). With the
+multistream dump's index file, the dump's bz2 streams are decompressed and
+parsed on several processes; without it the dump is read in one pass. Both
+keep memory bounded.
+
+Membership comes from the [[Category:...]] links in each page's own
+wikitext, so categories added by templates are missed, and texts are a
+plain-text rendering of the wikitext close to what TextExtracts returns.
+
+    python wiki_dump.py enwiki-latest-pages-articles-multistream.xml.bz2 \\
+        --index enwiki-latest-pages-articles-multistream-index.txt.bz2 \\
+        --output dump_index.sqlite3 --workers 8
+"""
+
+import argparse
+import bz2
+import html
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+# bz2 streams handed to a worker at a time; the multistream dump packs 100
+# pages into each.
+STREAMS_PER_TASK = 10
+# Rows written per transaction.
+WRITE_BATCH = 5000
+# Seconds between progress reports.
+REPORT_INTERVAL = 10
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    pageid INTEGER PRIMARY KEY,
+    ns INTEGER NOT NULL,
+    title TEXT NOT NULL,
+    revid INTEGER NOT NULL,
+    text BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS categorylinks (
+    category TEXT NOT NULL,
+    pageid INTEGER NOT NULL,
+    PRIMARY KEY (category, pageid)
+) WITHOUT ROWID;
+"""
+
+_CATEGORY_LINK = re.compile(
+    r"\[\[\s*Category\s*:\s*([^\]|]+)(?:\|[^\]]*)?\]\]", re.I
+)
+_COMMENT = re.compile(r"<!--.*?-->", re.S)
+_REF = re.compile(r"<ref[^>]*/>|<ref[^>]*>.*?</ref>", re.S | re.I)
+_BLOCK_TAG = re.compile(
+    r"<(gallery|math|timeline|syntaxhighlight|score|chem|graph)[^>]*>.*?</\1>",
+    re.S | re.I,
+)
+_TAG = re.compile(r"<[^>]+>")
+# Innermost templates and tables; removed repeatedly to peel off nesting.
+_TEMPLATE = re.compile(r"\{\{[^{}]*\}\}")
+_TABLE = re.compile(r"\{\|(?:(?!\{\|).)*?\|\}", re.S)
+_FILE_LINK = re.compile(
+    r"\[\[\s*(?:File|Image|Category)\s*:(?:[^\[\]]|\[\[[^\[\]]*\]\])*\]\]", re.I
+)
+_LINK = re.compile(r"\[\[(?:[^|\[\]]*\|)?([^\[\]]*)\]\]")
+_EXTERNAL_LINK = re.compile(r"\[(?:https?:)?//[^\s\]]+\s*([^\]]*)\]")
+_HEADING = re.compile(r"^(=+)\s*(.*?)\s*\1\s*$", re.M)
+_QUOTES = re.compile(r"'{2,}")
+_LIST_MARK = re.compile(r"^[*#:;]+\s*", re.M)
+_BLANK_LINES = re.compile(r"\n{3,}")
+
+
+def normalize_category(name):
+    """Category name as used for lookups: no prefix, underscores, capitalized."""
+    name = re.sub(r"^\s*Category\s*:", "", name, flags=re.I).strip()
+    name = re.sub(r"[\s_]+", "_", name)
+    return name[:1].upper() + name[1:]
+
+
+def _remove_nested(pattern, text):
+    while True:
+        text, n = pattern.subn("", text)
+        if not n:
+            return text
+
+
+def wikitext_to_text(wikitext):
+    """Render wikitext as plain text: markup, templates, tables and refs dropped."""
+    text = _COMMENT.sub("", wikitext)
+    text = _REF.sub("", text)
+    text = _BLOCK_TAG.sub("", text)
+    text = _remove_nested(_TEMPLATE, text)
+    text = _remove_nested(_TABLE, text)
+    text = _FILE_LINK.sub("", text)
+    text = _LINK.sub(r"\1", text)
+    text = _EXTERNAL_LINK.sub(r"\1", text)
+    text = _TAG.sub("", text)
+    text = _HEADING.sub(r"\1 \2 \1", text)
+    text = _QUOTES.sub("", text)
+    text = _LIST_MARK.sub("", text)
+    text = html.unescape(text)
+    return _BLANK_LINES.sub("\n\n", text).strip()
+
+
+def _page_row(page):
+    """Index row for an article or category page; None for anything else.
+
+    Rows are (pageid, ns, title, revid, compressed text, categories).
+    """
+    ns = int(page.findtext("ns"))
+    if ns not in (0, 14) or page.find("redirect") is not None:
+        return None
+    revision = page.find("revision")
+    wikitext = revision.findtext("text") or ""
+    categories = sorted(
+        {normalize_category(name) for name in _CATEGORY_LINK.findall(wikitext)}
+    )
+    # Category pages are only needed for the category graph.
+    text = wikitext_to_text(wikitext) if ns == 0 else ""
+    return (
+        int(page.findtext("id")),
+        ns,
+        page.findtext("title"),
+        int(revision.findtext("id")),
+        zlib.compress(text.encode()),
+        categories,
+    )
+
+
+def _ingest_streams(dump_path, start, end):
+    """Worker side: rows for the pages in bz2 streams at bytes [start, end)."""
+    import xml.etree.ElementTree as ET
+
+    with open(dump_path, "rb") as f:
+        f.seek(start)
+        data = bz2.decompress(f.read(end - start))
+    # The streams hold whole <page> elements, apart from the <mediawiki>
+    # header in the first one and the footer in the last.
+    first, last = data.find(b"<page>"), data.rfind(b"</page>")
+    if first < 0:
+        return [], end - start
+    pages = data[first : last + len(b"</page>")]
+    root = ET.fromstring(b"<pages>" + pages + b"</pages>")
+    rows = [row for row in map(_page_row, root.iter("page")) if row]
+    return rows, end - start
+
+
+def _iter_dump_pages(dump_path):
+    """Yield each <page> of a dump, namespace stripped, discarding it afterwards."""
+    import xml.etree.ElementTree as ET
+
+    with bz2.open(dump_path, "rb") as f:
+        root = None
+        for event, elem in ET.iterparse(f, events=("start", "end")):
+            if root is None:
+                root = elem
+            if event != "end":
+                continue
+            elem.tag = elem.tag.rpartition("}")[2]
+            if elem.tag == "page":
+                yield elem
+                root.clear()
+
+
+def _stream_ranges(dump_path, index_path, streams_per_task=STREAMS_PER_TASK):
+    """Byte ranges of groups of bz2 streams, from a multistream index file."""
+    offsets = []
+    with bz2.open(index_path, "rt", encoding="utf-8") as f:
+        for line in f:
+            offset = int(line.split(":", 1)[0])
+            if not offsets or offset != offsets[-1]:
+                offsets.append(offset)
+    offsets.append(os.path.getsize(dump_path))
+    for i in range(0, len(offsets) - 1, streams_per_task):
+        yield offsets[i], offsets[min(i + streams_per_task, len(offsets) - 1)]
+
+
+def _iter_rows(dump_path, index_path, workers):
+    """Yield (rows, compressed bytes read) as the dump is parsed."""
+    if index_path is None:
+        rows = []
+        for page in _iter_dump_pages(dump_path):
+            row = _page_row(page)
+            if row:
+                rows.append(row)
+            if len(rows) >= WRITE_BATCH:
+                yield rows, None
+                rows = []
+        yield rows, None
+        return
+    with ProcessPoolExecutor(workers) as pool:
+        pending = set()
+        for start, end in _stream_ranges(dump_path, index_path):
+            pending.add(pool.submit(_ingest_streams, dump_path, start, end))
+            # Bound memory: never more than a couple of tasks per worker.
+            if len(pending) >= 2 * workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        for future in pending:
+            yield future.result()
+
+
+def ingest(dump_path, output, index_path=None, workers=None):
+    """Build the index at `output` from a dump; return ingestion statistics.
+
+    The index is written next to `output` and moved into place at the end, so
+    a previous index keeps being served while a new one is built.
+    """
+    workers = workers or os.cpu_count() or 1
+    tmp_path = output + ".tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    conn = sqlite3.connect(tmp_path, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=OFF")
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.executescript(_SCHEMA)
+
+    pages = articles = 0
+    read = 0
+    start = last_report = time.perf_counter()
+    for rows, nbytes in _iter_rows(dump_path, index_path, workers):
+        conn.execute("BEGIN")
+        conn.executemany(
+            "INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?)",
+            [row[:5] for row in rows],
+        )
+        conn.executemany(
+            "INSERT OR IGNORE INTO categorylinks VALUES (?, ?)",
+            [(category, row[0]) for row in rows for category in row[5]],
+        )
+        conn.execute("COMMIT")
+        pages += len(rows)
+        articles += sum(1 for row in rows if row[1] == 0)
+        read = read + nbytes if nbytes is not None else None
+        now = time.perf_counter()
+        if now - last_report >= REPORT_INTERVAL:
+            last_report = now
+            print(_progress(pages, read, now - start))
+
+    conn.close()
+    os.replace(tmp_path, output)
+    elapsed = time.perf_counter() - start
+    if read is None:
+        read = os.path.getsize(dump_path)
+    print(_progress(pages, read, elapsed))
+    return {
+        "pages": pages,
+        "articles": articles,
+        "seconds": elapsed,
+        "compressed_bytes": read,
+        "workers": workers if index_path else 1,
+    }
+
+
+def _progress(pages, read, elapsed):
+    line = f"{pages} pages in {elapsed:.1f} s ({pages / elapsed:.0f} pages/s"
+    if read is not None:
+        line += f", {read / 1024**2 / elapsed:.1f} MiB/s of bz2"
+    return line + ")"
+
+
+_local = threading.local()
+
+
+def get_connection(path):
+    """Return this thread's read connection to the index at `path`."""
+    conns = getattr(_local, "conns", None)
+    if conns is None or _local.pid != os.getpid():
+        conns = _local.conns = {}
+        _local.pid = os.getpid()
+    if path not in conns:
+        conns[path] = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    return conns[path]
+
+
+def _members(path, category, ns):
+    return get_connection(path).execute(
+        """
+        SELECT pages.pageid, title, revid FROM categorylinks
+        JOIN pages USING (pageid)
+        WHERE category = ? AND ns = ?
+        ORDER BY pages.pageid
+        """,
+        (normalize_category(category), ns),
+    )
+
+
+def category_pages(path, category):
+    """Articles of a category as [{pageid, title, lastrevid}]."""
+    return [
+        {"pageid": pageid, "title": title, "lastrevid": revid}
+        for pageid, title, revid in _members(path, category, 0)
+    ]
+
+
+def category_node(path, category):
+    """A category's articles and subcategories, as `list_category` returns them."""
+    return {
+        "pages": category_pages(path, category),
+        "subcategories": [
+            normalize_category(title) for _, title, _ in _members(path, category, 14)
+        ],
+    }
+
+
+def page_revisions(path, pageids):
+    placeholders = ",".join("?" * len(pageids))
+    rows = get_connection(path).execute(
+        f"SELECT pageid, title, revid FROM pages WHERE pageid IN ({placeholders})",
+        list(pageids),
+    )
+    return [
+        {"pageid": pageid, "title": title, "lastrevid": revid}
+        for pageid, title, revid in rows
+    ]
+
+
+def pages_text(path, pageids):
+    """{pageid: text} for the given page ids; "" for pages not in the dump."""
+    texts = {pageid: "" for pageid in pageids}
+    placeholders = ",".join("?" * len(pageids))
+    rows = get_connection(path).execute(
+        f"SELECT pageid, text FROM pages WHERE pageid IN ({placeholders})",
+        list(pageids),
+    )
+    for pageid, text in rows:
+        texts[pageid] = zlib.decompress(text).decode()
+    return texts
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Index a Wikipedia XML dump for offline category counts."
+    )
+    parser.add_argument("dump", help="pages-articles(-multistream) .xml.bz2 dump")
+    parser.add_argument(
+        "--index",
+        help="the multistream dump's index (.txt.bz2); enables parallel parsing",
+    )
+    parser.add_argument("--output", default="dump_index.sqlite3")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="processes parsing the dump with --index (default: one per CPU core)",
+    )
+    args = parser.parse_args()
+    stats = ingest(args.dump, args.output, args.index, args.workers)
+    print(
+        f"Indexed {stats['articles']} articles and "
+        f"{stats['pages'] - stats['articles']} categories into {args.output}"
+    )
+
+
+if __name__ == "__main__":
+    main()
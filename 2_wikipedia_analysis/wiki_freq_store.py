@@ -0,0 +1,512 @@
+"""Word frequencies stored as vocabulary ids and counts in NumPy arrays.
+
+Each word is stored once, in a vocabulary shared by every category
+(`vocab.txt`, one word per line; a word's id is its line number). A
+category's frequencies are a `.npy` file of (id, count) records sorted most
+common first. Files are memory-mapped when loaded, so the top k words are
+the first k records and nothing after them is read from disk.
+
+`vocab.idx` holds the byte offset at which each word of the vocabulary ends,
+as little-endian uint64s. A process that hasn't read the vocabulary looks up
+a few ids by reading their offsets and words alone, so `load_top` costs the
+same for a category of a thousand words as for one of millions.
+
+The files count towards the cache's size budget (`CACHE_MAX_BYTES`), tracked
+in the SQLite database: tables are evicted with its entries, least recently
+used first. The vocabulary is counted but never evicted, as every table's
+ids point into it. It only grows, so when it passes `VOCAB_MAX_SHARE` of the
+budget the whole store is reset. Tables are then computed again as they are
+requested, from the per-page counts and category totals kept in SQLite, and
+only the words still in use are interned again.
+
+Each reset starts a new generation of the vocabulary, named in `vocab.gen`.
+Tables remember the generation their ids belong to, and resolving the ids of
+a table from an earlier generation raises `VocabularyReset` instead of
+returning the words that now have those ids.
+"""
+
+import hashlib
+import mmap
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+import wiki_cache_utils
+import wiki_metrics as metrics
+
+try:
+    import fcntl
+except ImportError:  # Windows: appends are only serialized within a process
+    fcntl = None
+
+STORE_DIR = "freq"
+VOCAB_FILE = "vocab.txt"
+INDEX_FILE = "vocab.idx"
+GENERATION_FILE = "vocab.gen"
+# The vocabulary's share of the cache budget, past which the store is reset.
+VOCAB_MAX_SHARE = 0.25
+_VOCAB_KEY = "vocabulary"
+# Expired tables are deleted at most this often per process.
+_PRUNE_INTERVAL = 3600
+# Records converted to words at a time when a table is iterated.
+_ITER_CHUNK = 512
+# Lookups of at most this many unread ids go through the vocabulary index;
+# larger ones read the rest of the vocabulary.
+_INDEX_LOOKUP_MAX = 4096
+
+_vocabularies = {}
+_vocabularies_lock = threading.Lock()
+_last_prune = 0.0
+
+
+def store_dir():
+    return os.path.join(wiki_cache_utils.CACHE_DIR, STORE_DIR)
+
+
+def _table_path(key):
+    name = hashlib.sha1(key.encode()).hexdigest()
+    return os.path.join(store_dir(), name + ".npy")
+
+
+class VocabularyReset(Exception):
+    """A table's ids belong to a vocabulary that has been reset since."""
+
+
+class Vocabulary:
+    """The append-only word list, shared by processes through one file.
+
+    Words appended by other processes are read when an id is not known yet;
+    appends are serialized with an exclusive lock on the file, and the index
+    of word offsets is appended to under the same lock.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.index_path = os.path.join(os.path.dirname(path), INDEX_FILE)
+        self.words = []
+        self.ids = {}
+        self.generation_path = os.path.join(os.path.dirname(path), GENERATION_FILE)
+        self.words = []
+        self.ids = {}
+        self._size = 0  # bytes of the file read so far
+        self._inode = None
+        self._generation = None  # of the words read
+        self._lock = threading.Lock()
+
+    def generation(self):
+        """The current generation of the vocabulary, or None before its first word."""
+        try:
+            with open(self.generation_path) as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def _new_generation(self):
+        """Start a new generation; the file lock must be held."""
+        generation = os.urandom(8).hex()
+        tmp = f"{self.generation_path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            f.write(generation)
+        os.replace(tmp, self.generation_path)
+        return generation
+
+    def check(self, generation):
+        """Raise VocabularyReset unless `generation` is the current one."""
+        if generation != self.generation():
+            raise VocabularyReset("the vocabulary was reset since the table was read")
+
+    def _read_new(self, f):
+        """Read the words appended since the last call; the lock must be held."""
+        st = os.fstat(f.fileno())
+        generation = self.generation()
+        if (
+            st.st_ino != self._inode
+            or generation != self._generation
+            or st.st_size < self._size
+        ):
+            # The cache was cleared or reset: start over from the new file
+            self.words, self.ids, self._size = [], {}, 0
+            self._inode, self._generation = st.st_ino, generation
+        f.seek(self._size)
+        data = f.read()
+        # A crashed writer can leave a partial last line; it is overwritten
+        end = data.rfind(b"\n") + 1
+        for word in data[:end].decode().split("\n")[:-1]:
+            self.ids[word] = len(self.words)
+            self.words.append(word)
+        self._size += end
+
+    def _clear(self):
+        self.words, self.ids, self._size = [], {}, 0
+        self._inode = self._generation = None
+
+    def refresh(self):
+        with self._lock:
+            try:
+                with open(self.path, "rb") as f:
+                    self._read_new(f)
+            except FileNotFoundError:
+                self._clear()
+
+    def _replaced(self):
+        """Whether the file was deleted or replaced since it was last read."""
+        if self.generation() != self._generation:
+            return True
+        try:
+            return os.stat(self.path).st_ino != self._inode
+        except FileNotFoundError:
+            return self._inode is not None
+
+    @contextmanager
+    def _locked_file(self):
+        """The vocabulary file, opened for appending with an exclusive lock.
+
+        A reset may delete the file while the lock is awaited; the new file is
+        opened and locked instead.
+        """
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        while True:
+            f = open(self.path, "ab+")
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                if os.fstat(f.fileno()).st_ino == os.stat(self.path).st_ino:
+                    break
+            except FileNotFoundError:
+                pass
+            f.close()  # releases the lock
+        with f:
+            yield f
+
+    def intern(self, words):
+        """Return the ids of `words` as an array, adding the ones not seen yet.
+
+        Also returns the generation the ids belong to.
+        """
+        with self._lock:
+            if self.words and self._replaced():
+                self._clear()  # the ids known are from before a reset
+            missing = [word for word in words if word not in self.ids]
+            if missing:
+                with self._locked_file() as f:
+                    if self.generation() is None:
+                        self._new_generation()  # the first word of this cache
+                    self._read_new(f)
+                    missing = [word for word in missing if word not in self.ids]
+                    start, first = self._size, len(self.words)
+                    f.truncate(self._size)
+                    f.write("".join(word + "\n" for word in missing).encode())
+                    f.flush()
+                    self._read_new(f)
+                    self._append_index(start, first)
+                    size = self._size + 8 * len(self.words)  # words and index
+                    wiki_cache_utils.track_file(
+                        _VOCAB_KEY, self.path, size, pinned=True
+                    )
+            ids = np.fromiter(
+                (self.ids[word] for word in words), dtype=np.uint32, count=len(words)
+            )
+            return ids, self._generation
+
+    def _append_index(self, start, first):
+        """Index the words from `first` on, which start at byte `start`.
+
+        The file lock must be held. An index that doesn't end at `first`
+        (from an older cache, or a writer that died) is rebuilt.
+        """
+        with open(self.index_path, "ab+") as f:
+            if os.fstat(f.fileno()).st_size != first * 8:
+                f.truncate(0)
+                start = first = 0
+            new = self.words[first:]
+            lengths = np.fromiter(
+                (len(word.encode()) + 1 for word in new), np.uint64, len(new)
+            )
+            f.write((start + np.cumsum(lengths)).astype("<u8").tobytes())
+
+    def _read_indexed(self, ids):
+        """Read the words of `ids` through the index; None if it lacks any."""
+        try:
+            with open(self.index_path, "rb") as f:
+                indexed = os.fstat(f.fileno()).st_size // 8
+                if not indexed or max(ids) >= indexed:
+                    return None
+                ends = np.memmap(f, dtype="<u8", mode="r", shape=(indexed,))
+                positions = np.asarray(ids)
+                stops = ends[positions].tolist()
+                starts = np.where(positions > 0, ends[positions - 1], 0).tolist()
+                del ends
+            with open(self.path, "rb") as f:
+                text = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            with text:
+                # Each word must sit between two line ends, or the index and
+                # the words are out of step: read them all instead
+                if max(stops) > len(text) or any(
+                    text[stop - 1] != 10 or (start and text[start - 1] != 10)
+                    for start, stop in zip(starts, stops)
+                ):
+                    return None
+                pairs = zip(starts, stops)
+                return [text[start : stop - 1].decode() for start, stop in pairs]
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def lookup(self, ids, generation=None):
+        """Return the words with the given ids.
+
+        With `generation`, raises VocabularyReset if the ids are from another.
+        """
+        ids = ids.tolist()
+        if not ids:
+            return []
+        if generation is not None:
+            self.check(generation)
+        if self.words and self._replaced():
+            self.refresh()  # the store was reset: the words read are stale
+        if ids and max(ids) >= len(self.words):
+            if len(ids) <= _INDEX_LOOKUP_MAX:
+                words = self._read_indexed(ids)
+                if words is not None:
+                    return words
+            self.refresh()
+        words = self.words
+        return [words[i] for i in ids]
+
+
+def get_vocabulary():
+    """Return this process's view of the vocabulary in the current cache."""
+    path = os.path.join(store_dir(), VOCAB_FILE)
+    key = (path, os.getpid())
+    with _vocabularies_lock:
+        vocabulary = _vocabularies.get(key)
+        if vocabulary is None:
+            vocabulary = _vocabularies[key] = Vocabulary(path)
+    return vocabulary
+
+
+def _records(ids, counts):
+    """Pack ids and counts into records, most common first (ties by id)."""
+    order = np.lexsort((ids, -counts.astype(np.int64)))
+    # Counts take the smallest type that fits: most categories need 16 bits
+    largest = int(counts.max()) if len(counts) else 0
+    count = next(t for t in ("<u2", "<u4", "<u8") if largest <= np.iinfo(t).max)
+    dtype = np.dtype([("id", "<u4"), ("count", count)])
+    records = np.empty(len(order), dtype=dtype)
+    records["id"] = ids[order]
+    records["count"] = counts[order]
+    return records
+
+
+class FrequencyTable:
+    """A category's word counts, most common first.
+
+    Iterating yields (word, count) pairs, like `Counter.most_common()`, but
+    only converts the records that are actually reached. `saved_at` is when
+    a loaded table was stored, and `generation` the vocabulary generation its
+    ids belong to.
+    """
+
+    def __init__(self, records, vocabulary, saved_at=None, generation=None):
+        self.records = records
+        self.vocabulary = vocabulary
+        self.saved_at = saved_at
+        self.generation = generation
+
+    @property
+    def ids(self):
+        return self.records["id"]
+
+    @property
+    def counts(self):
+        return self.records["count"]
+
+    def __len__(self):
+        return len(self.records)
+
+    def __iter__(self):
+        for start in range(0, len(self.records), _ITER_CHUNK):
+            yield from self.most_common(_ITER_CHUNK, start)
+
+    def total(self):
+        return int(self.counts.sum(dtype=np.uint64))
+
+    def lookup(self, ids):
+        """Return the words of some of the table's ids."""
+        return self.vocabulary.lookup(ids, self.generation)
+
+    def most_common(self, n=None, start=0):
+        """Return the (word, count) pairs ranked start to start + n."""
+        records = self.records[start : None if n is None else start + n]
+        words = self.lookup(records["id"])
+        return list(zip(words, records["count"].tolist()))
+
+    def nbytes(self):
+        return self.records.nbytes
+
+
+def from_counts(freq, vocabulary=None):
+    """Build a table from a Counter, a dict or (word, count) pairs."""
+    vocabulary = vocabulary or get_vocabulary()
+    pairs = list(freq.items() if hasattr(freq, "items") else freq)
+    words = [word for word, _ in pairs]
+    counts = np.fromiter((count for _, count in pairs), np.uint64, len(pairs))
+    ids, generation = vocabulary.intern(words)
+    return FrequencyTable(_records(ids, counts), vocabulary, generation=generation)
+
+
+def merge(tables, n=None):
+    """Sum the counts of several tables; keep only the top `n` if given.
+
+    Counts are summed with one `bincount` over the concatenated ids, and with
+    `n` only the top n are sorted, after an `argpartition`. The tables must
+    be of one generation.
+    """
+    vocabulary = tables[0].vocabulary if tables else get_vocabulary()
+    generation = tables[0].generation if tables else None
+    if any(table.generation != generation for table in tables):
+        raise VocabularyReset("the tables are of different vocabularies")
+    ids = np.concatenate([table.ids for table in tables] or [[]]).astype(np.intp)
+    counts = np.concatenate([table.counts for table in tables] or [[]])
+    totals = np.bincount(ids, weights=counts).astype(np.uint64)
+    ids = np.flatnonzero(totals)
+    counts = totals[ids]
+    if n is not None and n < len(ids):
+        top = np.argpartition(counts, len(ids) - n)[len(ids) - n :]
+        ids, counts = ids[top], counts[top]
+    return FrequencyTable(_records(ids, counts), vocabulary, generation=generation)
+
+
+def _vocabulary_bytes():
+    size = 0
+    for name in (VOCAB_FILE, INDEX_FILE):
+        try:
+            size += os.path.getsize(os.path.join(store_dir(), name))
+        except FileNotFoundError:
+            pass
+    return size
+
+
+def reset_store():
+    """Delete every table and the vocabulary, which then starts again empty."""
+    vocabulary = get_vocabulary()
+    with vocabulary._lock, vocabulary._locked_file():
+        removed = []
+        with os.scandir(store_dir()) as entries:
+            for entry in entries:
+                if entry.name.endswith(".npy"):
+                    removed.append(entry.path)
+        removed += [vocabulary.index_path, vocabulary.path]
+        for path in removed:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        wiki_cache_utils.forget_files(removed)
+        vocabulary._clear()
+        # Tables still held in memory now fail to resolve their ids
+        vocabulary._new_generation()
+
+
+@metrics.timed("wiki_stage_seconds", stage="cache_write")
+def save_frequencies(key, freq):
+    """Store a table (or anything `from_counts` accepts) under `key`."""
+    if isinstance(freq, FrequencyTable) and len(freq):
+        freq.vocabulary.check(freq.generation)
+    if _vocabulary_bytes() > wiki_cache_utils.CACHE_MAX_BYTES * VOCAB_MAX_SHARE:
+        if isinstance(freq, FrequencyTable):
+            freq = list(freq)  # its words, before their ids are gone
+        reset_store()
+    if not isinstance(freq, FrequencyTable):
+        freq = from_counts(freq)
+    path = _table_path(key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Replaced in one rename, so readers (and their maps) see a whole file
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "wb") as f:
+        np.save(f, np.asarray(freq.records))
+        size = f.tell()
+    os.replace(tmp, path)
+    metrics.inc("wiki_cache_bytes_written_total", size, kind="result")
+    wiki_cache_utils.track_file(key, path, size)
+    prune_frequencies()
+
+
+def load_frequencies(key, max_age=None):
+    """Return the table stored under `key`, memory-mapped, or None if missing.
+
+    Tables older than `max_age` seconds (default: the result TTL) are treated
+    as missing.
+    """
+    max_age = wiki_cache_utils.RESULT_TTL if max_age is None else max_age
+    with metrics.timer("wiki_stage_seconds", stage="cache_read"):
+        table = _load_frequencies(_table_path(key), max_age)
+    result = "miss" if table is None else "hit"
+    metrics.inc("wiki_cache_requests_total", kind="result", result=result)
+    if table is not None:
+        wiki_cache_utils.touch_file(key)
+    return table
+
+
+def load_top(key, k, max_age=None):
+    """Return the k most common (word, count) pairs stored under `key`, or None.
+
+    Only the first k records and, through the vocabulary index, their k words
+    are read from disk.
+    """
+    table = load_frequencies(key, max_age)
+    return None if table is None else table.most_common(k)
+
+
+def _load_frequencies(path, max_age):
+    vocabulary = get_vocabulary()
+    # Read first: a reset between it and the load can only make the table
+    # look older than it is, never newer
+    generation = vocabulary.generation()
+    try:
+        saved_at = os.path.getmtime(path)
+        if time.time() - saved_at > max_age:
+            return None
+        records = np.load(path, mmap_mode="r")
+    except FileNotFoundError:
+        return None
+    return FrequencyTable(records, vocabulary, saved_at, generation)
+
+
+def frequencies_age(key):
+    """Seconds since the table under `key` was stored, or None if there is none."""
+    try:
+        return time.time() - os.path.getmtime(_table_path(key))
+    except FileNotFoundError:
+        return None
+
+
+def prune_frequencies(max_age=None, force=False):
+    """Delete tables past `max_age`; runs at most once an hour unless forced.
+
+    By default tables are kept for the result TTL and then for STALE_TTL,
+    during which they may still be served while they are recomputed. The
+    vocabulary is never pruned: ids must stay valid for the tables left (see
+    `reset_store` for how it is rebuilt).
+    """
+    global _last_prune
+    now = time.time()
+    if not force and now - _last_prune < _PRUNE_INTERVAL:
+        return
+    _last_prune = now
+    if max_age is None:
+        max_age = wiki_cache_utils.RESULT_TTL + wiki_cache_utils.STALE_TTL
+    removed = []
+    with os.scandir(store_dir()) as entries:
+        for entry in entries:
+            if not entry.name.endswith(".npy"):
+                continue
+            try:
+                if now - entry.stat().st_mtime > max_age:
+                    os.remove(entry.path)
+                    removed.append(entry.path)
+            except FileNotFoundError:
+                pass
+    wiki_cache_utils.forget_files(removed)
@@ -0,0 +1,116 @@
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+
+class QueueFull(Exception):
+    pass
+
+
+class Job:
+    """A background computation whose progress can be polled or waited on."""
+
+    def __init__(self, category):
+        self.id = uuid.uuid4().hex
+        self.category = category
+        self.status = QUEUED
+        self.progress = {}
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+        # Bumped on every change so subscribers can wait for the next one.
+        self.version = 0
+        self._changed = threading.Condition()
+
+    @property
+    def finished(self):
+        return self.status in (DONE, FAILED)
+
+    def update(self, status=None, error=None, **progress):
+        with self._changed:
+            if status:
+                self.status = status
+                if self.finished:
+                    self.finished_at = time.time()
+            if error:
+                self.error = error
+            self.progress.update(progress)
+            self.version += 1
+            self._changed.notify_all()
+
+    def wait_for_change(self, version, timeout=None):
+        """Block until the job changes past `version`; return its new version."""
+        with self._changed:
+            self._changed.wait_for(
+                lambda: self.version != version or self.finished, timeout
+            )
+            return self.version
+
+    def snapshot(self):
+        with self._changed:
+            return {
+                "id": self.id,
+                "category": self.category,
+                "status": self.status,
+                "progress": dict(self.progress),
+                "error": self.error,
+            }
+
+
+class JobRunner:
+    """Runs `run(category, progress)` on a bounded thread pool.
+
+    At most `max_queued` jobs may wait for a worker; submitting while a job for
+    the same category is queued or running returns that job instead of
+    starting another. Finished jobs are kept for `retention` seconds.
+    """
+
+    def __init__(self, run, max_workers=2, max_queued=16, retention=3600):
+        self.run = run
+        self.max_queued = max_queued
+        self.retention = retention
+        self._executor = ThreadPoolExecutor(max_workers, thread_name_prefix="job")
+        self._jobs = {}
+        self._active = {}
+        self._lock = threading.Lock()
+
+    def submit(self, category):
+        with self._lock:
+            self._prune()
+            job = self._active.get(category)
+            if job is not None:
+                return job
+            queued = sum(1 for j in self._active.values() if j.status == QUEUED)
+            if queued >= self.max_queued:
+                raise QueueFull(f"{queued} jobs are already waiting")
+            job = Job(category)
+            self._jobs[job.id] = job
+            self._active[category] = job
+        self._executor.submit(self._run, job)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _run(self, job):
+        job.update(status=RUNNING)
+        try:
+            self.run(job.category, job.update)
+        except Exception as e:
+            job.update(status=FAILED, error=str(e))
+        else:
+            job.update(status=DONE)
+        finally:
+            with self._lock:
+                if self._active.get(job.category) is job:
+                    del self._active[job.category]
+
+    def _prune(self):
+        cutoff = time.time() - self.retention
+        for job_id, job in list(self._jobs.items()):
+            if job.finished and job.finished_at < cutoff:
+                del self._jobs[job_id]
@@ -0,0 +1,225 @@
+"""Word cloud layout on the server, rendered as SVG.
+
+Words are placed like d3-cloud places them in the browser: largest first,
+each moved outwards along an Archimedean spiral from the centre until it
+overlaps no word placed before it. Collisions are tested on a bitmap of the
+canvas at CELL-pixel resolution. Each word's mask is built from per-letter
+boxes (letter widths of Arial, with ascenders and descenders), rotated and
+padded. For each word, a summed-area table of the canvas finds the first
+spiral position whose bounding box is empty. The positions before it are
+checked against the exact mask in vectorized batches.
+
+No font is rasterized, so masks follow the letters only roughly. Browsers
+draw the words in the font of the SVG, which is close enough to Arial.
+"""
+
+import zlib
+from xml.sax.saxutils import escape
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+WIDTH, HEIGHT = 1000, 800
+# Pixels per bitmap cell: smaller packs tighter but is slower.
+CELL = 4
+MAX_WORDS = 150
+PADDING = 5
+MIN_FONT_SIZE, MAX_FONT_SIZE = 18, 120
+ROTATIONS = (0, 45, 90)
+FONT_FAMILY = '"Segoe UI", Arial, Helvetica, sans-serif'
+# Spiral positions tested against the exact masks at once.
+BATCH = 256
+
+# Advance widths of Arial, in thousandths of an em.
+_WIDTHS = dict(
+    zip(
+        "abcdefghijklmnopqrstuvwxyz",
+        [556, 556, 500, 556, 556, 278, 556, 556, 222, 222, 500, 222, 833]
+        + [556, 556, 556, 556, 333, 500, 278, 556, 500, 722, 500, 500, 500],
+    )
+)
+_WIDTHS.update(
+    zip(
+        "ABCDEFGHIJKLMNOPQRSTUVWXYZ",
+        [667, 667, 722, 722, 667, 611, 778, 722, 278, 500, 667, 556, 833]
+        + [722, 778, 667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611],
+    )
+)
+_WIDTHS.update({"-": 333, "'": 191, ".": 278})
+_DEFAULT_WIDTH = 556
+# Heights above and depths below the baseline, in ems.
+_CAP_HEIGHT, _X_HEIGHT, _DESCENT = 0.716, 0.519, 0.21
+_SHORT = set("acemnorsuvwxz")
+_DESCENDERS = set("gjpqy")
+
+
+def font_size(count, low, high):
+    """The font size of a word, scaled like the browser cloud scales it."""
+    if low == high:
+        return 40
+    normalized = (count - low) / (high - low)
+    return max(MIN_FONT_SIZE, min(MAX_FONT_SIZE, 18 + 102 * normalized**0.7))
+
+
+def font_weight(size):
+    return "bold" if size > 50 else "600" if size > 30 else "400"
+
+
+def rotation(word):
+    """The angle of a word: fixed per word, so a layout is reproducible."""
+    return ROTATIONS[zlib.crc32(word.encode()) % len(ROTATIONS)]
+
+
+def _letter_boxes(word, size, bold):
+    """(left, top, right, bottom) of each letter, relative to the text anchor.
+
+    The anchor is the middle of the baseline, as with text-anchor="middle".
+    """
+    scale = size / 1000 * (1.05 if bold else 1)
+    widths = np.array([_WIDTHS.get(c, _DEFAULT_WIDTH) for c in word]) * scale
+    right = np.cumsum(widths) - widths.sum() / 2
+    tops = [_X_HEIGHT if c in _SHORT else _CAP_HEIGHT for c in word]
+    bottoms = [_DESCENT if c in _DESCENDERS or c not in _WIDTHS else 0 for c in word]
+    return np.column_stack(
+        [right - widths, -np.array(tops) * size, right, np.array(bottoms) * size]
+    )
+
+
+def word_mask(word, size, angle, bold=False):
+    """A word's padded bitmap, and the cell of its anchor within it.
+
+    Returns (mask, (row, col)).
+    """
+    boxes = _letter_boxes(word, size, bold)
+    # Padding, and half a cell's diagonal so a cell touched by a letter is set
+    boxes += np.array([-1, -1, 1, 1]) * (PADDING + CELL * 0.71)
+    theta = np.radians(angle)
+    cos, sin = np.cos(theta), np.sin(theta)
+    corners = np.stack(
+        [boxes[:, [0, 2, 2, 0]], boxes[:, [1, 1, 3, 3]]], axis=-1
+    ).reshape(-1, 2)
+    xs = corners[:, 0] * cos - corners[:, 1] * sin
+    ys = corners[:, 0] * sin + corners[:, 1] * cos
+    col0, row0 = int(np.floor(xs.min() / CELL)), int(np.floor(ys.min() / CELL))
+    col1, row1 = int(np.ceil(xs.max() / CELL)), int(np.ceil(ys.max() / CELL))
+    # Centres of the cells, turned back into the word's unrotated frame
+    cy, cx = np.mgrid[row0:row1, col0:col1]
+    cx, cy = (cx + 0.5) * CELL, (cy + 0.5) * CELL
+    u = cx * cos + cy * sin
+    v = -cx * sin + cy * cos
+    inside = (
+        (u[..., None] >= boxes[:, 0])
+        & (v[..., None] >= boxes[:, 1])
+        & (u[..., None] <= boxes[:, 2])
+        & (v[..., None] <= boxes[:, 3])
+    )
+    return inside.any(axis=-1), (-row0, -col0)
+
+
+def spiral(rows, cols):
+    """Distinct (row, col) offsets along an Archimedean spiral, centre first.
+
+    Follows d3-cloud's spiral, stretched to the canvas's aspect ratio.
+    """
+    aspect = cols / rows
+    radius = np.hypot(rows, cols) / 2 * CELL
+    t = np.arange(0, radius * 10 / max(aspect, 1) + 10) * 0.1
+    xs = np.rint(aspect * t * np.cos(t) / CELL).astype(np.int64)
+    ys = np.rint(t * np.sin(t) / CELL).astype(np.int64)
+    offsets = np.column_stack([ys, xs])
+    _, first = np.unique(offsets, axis=0, return_index=True)
+    return offsets[np.sort(first)]
+
+
+def _first_free(grid, mask, tops, lefts):
+    """Index of the first position where `mask` fits on `grid`, or None."""
+    h, w = mask.shape
+    table = np.zeros((grid.shape[0] + 1, grid.shape[1] + 1), dtype=np.int32)
+    table[1:, 1:] = grid.cumsum(axis=0, dtype=np.int32).cumsum(axis=1)
+    filled = (
+        table[tops + h, lefts + w]
+        - table[tops, lefts + w]
+        - table[tops + h, lefts]
+        + table[tops, lefts]
+    )
+    empty = np.flatnonzero(filled == 0)
+    end = empty[0] if len(empty) else len(tops)
+    # Before the first empty box, the mask may still fit between letters
+    windows = sliding_window_view(grid, mask.shape)
+    for start in range(0, end, BATCH):
+        stop = min(start + BATCH, end)
+        hits = (windows[tops[start:stop], lefts[start:stop]] & mask).any(axis=(1, 2))
+        free = np.flatnonzero(~hits)
+        if len(free):
+            return start + free[0]
+    return end if len(empty) else None
+
+
+def layout(freq, width=WIDTH, height=HEIGHT, max_words=MAX_WORDS):
+    """Place the most common words of `freq` ((word, count) pairs, most first).
+
+    Returns a dict for each word that fit: its text, count, font size, angle
+    and the position (x, y) of the middle of its baseline.
+    """
+    words = list(freq)[:max_words]
+    if not words:
+        return []
+    counts = [count for _, count in words]
+    low, high = min(counts), max(counts)
+    rows, cols = -(-height // CELL), -(-width // CELL)
+    grid = np.zeros((rows, cols), dtype=bool)
+    offsets = spiral(rows, cols)
+    placed = []
+    for text, count in words:
+        size = round(font_size(count, low, high), 1)
+        angle = rotation(text)
+        mask, (anchor_row, anchor_col) = word_mask(text, size, angle, bold=size > 30)
+        h, w = mask.shape
+        tops = rows // 2 + offsets[:, 0] - anchor_row
+        lefts = cols // 2 + offsets[:, 1] - anchor_col
+        fits = (tops >= 0) & (lefts >= 0) & (tops + h <= rows) & (lefts + w <= cols)
+        tops, lefts = tops[fits], lefts[fits]
+        if not len(tops):
+            continue
+        i = _first_free(grid, mask, tops, lefts)
+        if i is None:
+            continue
+        top, left = tops[i], lefts[i]
+        grid[top : top + h, left : left + w] |= mask
+        placed.append(
+            {
+                "text": text,
+                "count": count,
+                "size": size,
+                "rotate": angle,
+                "x": int(left + anchor_col) * CELL,
+                "y": int(top + anchor_row) * CELL,
+            }
+        )
+    return placed
+
+
+def render_svg(placed, palette, width=WIDTH, height=HEIGHT):
+    """An SVG document of placed words, coloured in turn from `palette`."""
+    colors = list(palette)
+    lines = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {width} {height}" '
+        f'width="100%" height="100%" preserveAspectRatio="xMidYMid meet">',
+        f"<style>text{{font-family:{escape(FONT_FAMILY)};cursor:pointer}}"
+        "text:hover{fill-opacity:.8}</style>",
+    ]
+    for i, word in enumerate(placed):
+        text = escape(word["text"])
+        lines.append(
+            f'<text text-anchor="middle" transform="translate({word["x"]},{word["y"]})'
+            f'rotate({word["rotate"]})" font-size="{word["size"]}" '
+            f'font-weight="{font_weight(word["size"])}" '
+            f'fill="{colors[i % len(colors)]}">{text}'
+            f'<title>{text}: {word["count"]} occurrences</title></text>'
+        )
+    lines.append("</svg>")
+    return "\n".join(lines)
+
+
+def wordcloud_svg(freq, palette, width=WIDTH, height=HEIGHT):
+    return render_svg(layout(freq, width, height), palette, width, height)
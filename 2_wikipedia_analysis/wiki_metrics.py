@@ -0,0 +1,221 @@
+"""Counters and timings for the word-frequency pipeline.
+
+Instrumentation is off unless `enable()` is called (the web app and
+`--profile` do) or WIKI_METRICS=1 is set; while it is off every call returns
+immediately, so instrumented code pays no more than a function call. Values
+are per process and rendered in the Prometheus text format by `render()`.
+"""
+
+import functools
+import os
+import threading
+import time
+
+# Upper bounds (seconds) of the latency histogram buckets.
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+METRICS = {
+    "wiki_api_requests_total": ("counter", "MediaWiki API responses."),
+    "wiki_api_bytes_total": ("counter", "Bytes of MediaWiki API responses."),
+    "wiki_api_request_seconds": ("histogram", "MediaWiki API latency."),
+    "wiki_api_errors_total": ("counter", "Failed API requests."),
+    "wiki_api_retries_total": ("counter", "API requests retried."),
+    "wiki_stage_seconds": ("histogram", "Time spent in each pipeline stage."),
+    "wiki_pages_total": ("counter", "Pages by pipeline stage."),
+    "wiki_words_total": ("counter", "Words counted."),
+    "wiki_tokenize_seconds_total": ("counter", "Time spent tokenizing."),
+    "wiki_cache_requests_total": ("counter", "Cache lookups."),
+    "wiki_cache_bytes_written_total": ("counter", "Bytes written to the cache."),
+    "wiki_http_requests_total": ("counter", "HTTP requests served."),
+    "wiki_http_request_seconds": ("histogram", "HTTP request latency."),
+}
+
+_enabled = os.environ.get("WIKI_METRICS", "0") not in ("", "0")
+_lock = threading.Lock()
+_values = {}
+
+
+def enable(on=True):
+    global _enabled
+    _enabled = on
+
+
+def enabled():
+    return _enabled
+
+
+def reset():
+    with _lock:
+        _values.clear()
+
+
+def _series(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def inc(name, amount=1, **labels):
+    """Add `amount` to a counter."""
+    if not _enabled:
+        return
+    key = _series(name, labels)
+    with _lock:
+        _values[key] = _values.get(key, 0) + amount
+
+
+def observe(name, seconds, **labels):
+    """Record one observation in a histogram."""
+    if not _enabled:
+        return
+    key = _series(name, labels)
+    with _lock:
+        histogram = _values.get(key)
+        if histogram is None:
+            histogram = _values[key] = [[0] * len(BUCKETS), 0.0, 0]
+        buckets, _, _ = histogram
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                buckets[i] += 1
+                break
+        histogram[1] += seconds
+        histogram[2] += 1
+
+
+class _Timer:
+    __slots__ = ("name", "labels", "start")
+
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observe(self.name, time.perf_counter() - self.start, **self.labels)
+
+
+class _NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def timer(name, **labels):
+    """Context manager observing the duration of its block in a histogram."""
+    if not _enabled:
+        return _NULL_TIMER
+    return _Timer(name, labels)
+
+
+def timed(name, **labels):
+    """Decorator observing each call's duration in a histogram."""
+
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return fn(*args, **kwargs)
+            with _Timer(name, labels):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def _format_labels(labels, **extra):
+    pairs = [*labels, *extra.items()]
+    if not pairs:
+        return ""
+    escaped = (
+        (k, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for k, v in pairs
+    )
+    return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+
+def render():
+    """Return all metrics in the Prometheus text exposition format."""
+    with _lock:
+        values = {
+            key: ([*v[0]], v[1], v[2]) if isinstance(v, list) else v
+            for key, v in _values.items()
+        }
+    lines = []
+    for name, (kind, help_text) in METRICS.items():
+        series = sorted((k, v) for k, v in values.items() if k[0] == name)
+        if not series:
+            continue
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for (_, labels), value in series:
+            if kind == "counter":
+                lines.append(f"{name}{_format_labels(labels)} {value}")
+                continue
+            buckets, total, count = value
+            cumulative = 0
+            for bound, n in zip(BUCKETS, buckets):
+                cumulative += n
+                le = _format_labels(labels, le=bound)
+                lines.append(f"{name}_bucket{le} {cumulative}")
+            lines.append(f"{name}_bucket{_format_labels(labels, le='+Inf')} {count}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {total}")
+            lines.append(f"{name}_count{_format_labels(labels)} {count}")
+    return "\n".join(lines) + "\n"
+
+
+def _total(name, **match):
+    """Sum a counter (or a histogram's count and sum) over matching series."""
+    count, total = 0, 0.0
+    with _lock:
+        for (series_name, labels), value in _values.items():
+            if series_name != name or not match.items() <= dict(labels).items():
+                continue
+            if isinstance(value, list):
+                count += value[2]
+                total += value[1]
+            else:
+                total += value
+    return count, total
+
+
+def summary(elapsed):
+    """A short human-readable report of a run that took `elapsed` seconds."""
+    _, requests = _total("wiki_api_requests_total")
+    _, errors = _total("wiki_api_errors_total")
+    _, retries = _total("wiki_api_retries_total")
+    _, received = _total("wiki_api_bytes_total")
+    _, api_seconds = _total("wiki_api_request_seconds")
+    _, fetched = _total("wiki_pages_total", stage="fetched")
+    _, tokenized = _total("wiki_pages_total", stage="tokenized")
+    _, words = _total("wiki_words_total")
+    _, tokenize_seconds = _total("wiki_tokenize_seconds_total")
+    lines = [
+        f"Run time:      {elapsed:.2f} s",
+        f"API requests:  {requests:.0f} ({errors:.0f} failed, "
+        f"{retries:.0f} retried), {received / 1024**2:.1f} MiB, "
+        f"{api_seconds:.2f} s waiting in total",
+        f"Pages fetched: {fetched:.0f} ({fetched / elapsed:.1f} pages/s)",
+        f"Tokenized:     {tokenized:.0f} pages, {words:.0f} words "
+        f"({words / tokenize_seconds if tokenize_seconds else 0:,.0f} words/s "
+        f"per process)",
+    ]
+    for stage in ("list", "update", "cache_read", "cache_write"):
+        count, seconds = _total("wiki_stage_seconds", stage=stage)
+        if count:
+            lines.append(f"Stage {stage + ':':<12} {count:>6} x, {seconds:.3f} s")
+    for kind in ("result", "state", "node", "counts", "page"):
+        _, hits = _total("wiki_cache_requests_total", kind=kind, result="hit")
+        _, misses = _total("wiki_cache_requests_total", kind=kind, result="miss")
+        if hits or misses:
+            lines.append(
+                f"Cache {kind + ':':<12} {hits:.0f} hits, {misses:.0f} misses "
+                f"({hits / (hits + misses):.0%} hit rate)"
+            )
+    return "\n".join(lines)
@@ -0,0 +1,73 @@
+"""Refresh popular results in the background before they expire.
+
+The web app counts requests per category with `record()`. A scheduler
+thread wakes every `interval` seconds and looks for requested categories
+whose stored result is older than `refresh_after`. It hands them to
+`submit`, most requested first, and stops when `submit` raises `QueueFull`.
+Counts are halved on each pass, so the order follows recent traffic and
+categories nobody asks for any more drop out.
+"""
+
+import threading
+from collections import Counter
+
+from wiki_jobs import QueueFull
+
+# Categories whose request counts are kept between passes.
+MAX_TRACKED = 1000
+
+
+class RefreshScheduler:
+    """Keeps the results of requested categories fresh.
+
+    `age(category)` returns the age of a category's result in seconds, or
+    None if it has none; `submit(category)` queues a refresh of it.
+    """
+
+    def __init__(self, age, submit, refresh_after, interval=60):
+        self.age = age
+        self.submit = submit
+        self.refresh_after = refresh_after
+        self.interval = interval
+        self.requests = Counter()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+
+    def record(self, category):
+        """Count a request for `category`; starts the scheduler on first use."""
+        with self._lock:
+            self.requests[category] += 1
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._loop, name="refresh", daemon=True
+                )
+                self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"Scheduled refresh failed: {e}")
+
+    def run_once(self):
+        """Submit refreshes for the due categories; return those submitted."""
+        with self._lock:
+            popular = [category for category, _ in self.requests.most_common()]
+            decayed = {c: n // 2 for c, n in self.requests.most_common(MAX_TRACKED)}
+            self.requests = +Counter(decayed)
+        submitted = []
+        for category in popular:
+            age = self.age(category)
+            if age is None or age < self.refresh_after:
+                continue
+            try:
+                self.submit(category)
+            except QueueFull:
+                break
+            submitted.append(category)
+        return submitted
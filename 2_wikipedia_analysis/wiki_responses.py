@@ -0,0 +1,91 @@
+"""Response bodies serialized and compressed once, then served as stored bytes.
+
+An `EncodedBody` keeps a body with its gzip (and, when the optional `brotli`
+package is installed, brotli) compressions and a hash of its contents.
+`send_body` picks the encoding the client accepts, so a cache hit is a
+dictionary lookup and a write of stored bytes: no serializing or compressing
+per request. Every encoding has its own strong ETag, and a client
+revalidating with `If-None-Match` gets an empty 304.
+"""
+
+import gzip
+import hashlib
+
+from flask import Response, request
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+# Bodies are compressed once, so the slowest, smallest settings are worth it.
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 11
+# Below this size compression saves less than the headers it adds.
+MIN_COMPRESS_BYTES = 256
+
+
+class EncodedBody:
+    """A response body with its precompressed encodings and their ETags.
+
+    `headers` are sent with every response of the body.
+    """
+
+    __slots__ = ("mimetype", "headers", "encodings", "etags", "size")
+
+    def __init__(self, data, mimetype="application/json", headers=None):
+        self.mimetype = mimetype
+        self.headers = headers or {}
+        self.encodings = {"identity": data}
+        if len(data) >= MIN_COMPRESS_BYTES:
+            self.encodings["gzip"] = gzip.compress(data, GZIP_LEVEL, mtime=0)
+            if brotli is not None:
+                self.encodings["br"] = brotli.compress(data, quality=BROTLI_QUALITY)
+        digest = hashlib.sha256(data).hexdigest()[:32]
+        self.etags = {
+            encoding: digest if encoding == "identity" else f"{digest}-{encoding}"
+            for encoding in self.encodings
+        }
+        self.size = sum(map(len, self.encodings.values()))
+
+    @property
+    def data(self):
+        return self.encodings["identity"]
+
+    def __len__(self):
+        # Bytes held, for caches bounded in size
+        return self.size
+
+
+def _negotiate(body):
+    accepted = request.accept_encodings
+    candidates = [e for e in ("br", "gzip") if e in body.encodings and accepted[e]]
+    if not candidates:
+        return "identity"
+    # The client's preference first, then the smaller encoding
+    return max(candidates, key=lambda encoding: accepted[encoding])
+
+
+def send_body(body, cache_control="no-cache"):
+    """Respond with the stored encoding of `body` the client prefers, or a 304.
+
+    The default `no-cache` lets clients keep the body but makes them
+    revalidate it on each use, which costs a 304 when it hasn't changed.
+    """
+    encoding = _negotiate(body)
+    etag = body.etags[encoding]
+    headers = {
+        "Cache-Control": cache_control,
+        "Vary": "Accept-Encoding",
+        **body.headers,
+    }
+    if request.if_none_match.contains(etag):
+        response = Response(status=304, headers=headers)
+    else:
+        response = Response(
+            body.encodings[encoding], mimetype=body.mimetype, headers=headers
+        )
+        if encoding != "identity":
+            response.headers["Content-Encoding"] = encoding
+    response.set_etag(etag)
+    return response
@@ -0,0 +1,69 @@
+"""Approximate word counts in bounded memory, for crawls too big to count exactly.
+
+`TopWords` is the Misra-Gries summary, the deterministic twin of
+Space-Saving: it tracks at most about twice `capacity` words, and whenever it
+holds more, it subtracts the (capacity + 1)-th largest count from every word
+and drops those left at zero. Updates go through `Counter.update`, as exact
+counting does, and pruning only runs once per `capacity` new words.
+
+Every count it reports is low by at most `error`, which never exceeds
+total / (capacity + 1); a word missing from the summary occurred at most
+`error` times. Summaries of separate parts of a crawl (from parallel workers,
+say) merge into one with the same guarantee over the whole crawl.
+"""
+
+import math
+from collections import Counter
+
+
+def capacity_for_error(max_error):
+    """The capacity that keeps the error under `max_error` x the words counted."""
+    return max(1, math.ceil(1 / max_error) - 1)
+
+
+class TopWords:
+    """Counts of the most frequent words, each low by at most `error`."""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.counts = Counter()
+        self.total = 0  # words counted
+        self.error = 0  # how much any count may be low
+
+    def update(self, counts):
+        """Add a Counter (or dict) of word counts, such as one page's."""
+        self.counts.update(counts)
+        self.total += sum(counts.values())
+        if len(self.counts) > 2 * self.capacity:
+            self._prune()
+
+    def merge(self, other):
+        """Add the words counted by another summary, then prune."""
+        self.counts.update(other.counts)
+        self.total += other.total
+        self.error += other.error
+        if len(self.counts) > self.capacity:
+            self._prune()
+
+    def _prune(self):
+        # The capacity + 1 largest counts are all at least `cut`, so the words
+        # removed add up to at least (capacity + 1) x `cut`: over all prunes,
+        # the error stays under total / (capacity + 1)
+        cut = sorted(self.counts.values())[-self.capacity - 1]
+        self.error += cut
+        self.counts = Counter(
+            {word: count - cut for word, count in self.counts.items() if count > cut}
+        )
+
+    def bound(self):
+        """The worst-case error for the words counted so far."""
+        return self.total // (self.capacity + 1)
+
+    def most_common(self, n=None):
+        return self.counts.most_common(n)
+
+    def items(self):
+        return self.counts.items()
+
+    def __len__(self):
+        return len(self.counts)
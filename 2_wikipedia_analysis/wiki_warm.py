@@ -0,0 +1,79 @@
+"""Precompute the word clouds of a list of categories, so no user waits for them.
+
+Categories are crawled in parallel by a bounded pool of threads, and stored
+exactly as the web app stores them. Categories with a result younger than the
+app's refresh age are skipped unless --force is given. Run it before a
+deploy, or from cron, with the categories users ask for most:
+
+    python wiki_warm.py Large_language_models Machine_learning
+    python wiki_warm.py -f categories.txt --workers 4
+"""
+
+import argparse
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import app
+from wiki_cache_utils import result_cache_age
+
+
+def read_categories(path):
+    """Category names from a file, one per line; blank lines and # comments skipped."""
+    with open(path, encoding="utf-8") as f:
+        lines = (line.split("#", 1)[0].strip() for line in f)
+        return [line for line in lines if line]
+
+
+def warm(category, force=False):
+    """Bring one category's stored result up to date; return a status line."""
+    age = result_cache_age(app.result_key(category))
+    if not force and age is not None and age < app.REFRESH_AFTER:
+        return f"fresh ({age / 3600:.1f} h old)"
+    start = time.time()
+    app.build_wordcloud(category, force_refresh=True)
+    elapsed = time.time() - start
+    stored = result_cache_age(app.result_key(category))
+    if stored is None or stored > elapsed:
+        raise ValueError("too few words to store")
+    return f"{'computed' if age is None else 'refreshed'} in {elapsed:.1f} s"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("categories", nargs="*", help="Wikipedia categories")
+    parser.add_argument("-f", "--file", help="file of categories, one per line")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=2,
+        help="categories crawled at the same time (default: 2)",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="recompute categories whose results are still fresh",
+    )
+    args = parser.parse_args()
+    categories = list(args.categories)
+    if args.file:
+        categories += read_categories(args.file)
+    if not categories:
+        parser.error("no categories given")
+    categories = list(dict.fromkeys(categories))
+
+    failed = 0
+    with ThreadPoolExecutor(max_workers=max(1, args.workers)) as pool:
+        futures = [pool.submit(warm, c, args.force) for c in categories]
+        for category, future in zip(categories, futures):
+            try:
+                print(f"{category}: {future.result()}", flush=True)
+            except Exception as e:
+                failed += 1
+                print(f"{category}: failed: {e}", file=sys.stderr, flush=True)
+    print(f"{len(categories) - failed} of {len(categories)} categories warm")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())